@@ -1,14 +1,55 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
+import math
 import os
+import random
+import time
 import uuid
+from datetime import datetime, timezone
 import shutil
+import socket
+import sqlite3
 import subprocess
+import threading
 import wave
 from pathlib import Path
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query, WebSocket
 from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
+import io
 import json
+import re
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
 from fastapi import Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+
+try:
+    import numpy as np
+except ImportError:  # optional: without numpy every conversion goes through ffmpeg
+    np = None
+
+try:
+    import httpx  # transport used by google-genai; only needed to classify network errors
+    _TRANSPORT_ERRORS = (httpx.TransportError,)
+except ImportError:
+    _TRANSPORT_ERRORS = ()
+
+try:
+    import av
+except ImportError:  # optional: only needed for AUDIO_CONVERTER=pyav
+    av = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: FileCounter falls back to an O_EXCL lock file
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 # initialize GenAI client (expects credentials configured in environment)
 client = genai.Client(api_key='GEMINI-API-Key')  # replace with your actual API key
@@ -19,8 +60,155 @@ DEFAULT_LOCAL_UPLOADS = Path(__file__).resolve().parent / "uploads"
 UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR") or DEFAULT_LOCAL_UPLOADS)
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# size of each read/write when copying uploads to disk; bounds per-request memory
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE") or 1024 * 1024)
+
+# feed uploads to ffmpeg over stdin instead of writing the input file first.
+# Only for containers ffmpeg can demux from a non-seekable pipe (mp4/m4a keep
+# their index at the end of the file, so they still go through disk).
+STREAM_CONVERT = os.environ.get("STREAM_CONVERT", "1").lower() not in ("0", "false", "no")
+PIPEABLE_EXTS = {".webm", ".ogg", ".opus", ".mp3", ".wav", ".flac", ".aac"}
+
+# ffmpeg process pool: max concurrent conversions and how many uploads may wait
+# for a slot before new ones are rejected with 503
+FFMPEG_MAX_PARALLEL = int(os.environ.get("FFMPEG_MAX_PARALLEL") or os.cpu_count() or 1)
+FFMPEG_MAX_QUEUE = int(os.environ.get("FFMPEG_MAX_QUEUE") or 4 * FFMPEG_MAX_PARALLEL)
+
+# target format produced by the converter: (channels, sample rate, sample width, compression)
+TARGET_WAV_FORMAT = (1, 16000, 2, "NONE")
+# bytes read from the start of an upload to sniff a WAV header
+WAV_SNIFF_BYTES = 4096
+
+# converter for compressed uploads: "ffmpeg" forks the ffmpeg CLI (default),
+# "pyav" decodes in-process with libav via PyAV
+AUDIO_CONVERTER = (os.environ.get("AUDIO_CONVERTER") or "ffmpeg").lower()
+
+# converter for PCM WAV uploads that are not already in the target format:
+# "numpy" resamples in-process (needs numpy), "ffmpeg" always forks ffmpeg
+PCM_CONVERTER = (os.environ.get("PCM_CONVERTER") or "numpy").lower()
+# largest up/down factor the polyphase resampler accepts; odd rates whose ratio
+# to 16 kHz reduces to bigger factors would need huge filters, so use ffmpeg
+PCM_MAX_RESAMPLE_FACTOR = 1000
+# output samples computed per vectorized block (bounds temporary memory)
+PCM_RESAMPLE_BLOCK = 16384
+# input frames read from the WAV per step, so memory stays flat for long files
+PCM_READ_FRAMES = 65536
+
+# skip conversion when the exact same bytes were uploaded before
+UPLOAD_DEDUP = os.environ.get("UPLOAD_DEDUP", "1").lower() not in ("0", "false", "no")
+
+# resumable uploads: chunks are appended to UPLOAD_DIR/.staging/<id>.part and
+# sessions untouched for this long are purged
+STAGING_DIR = UPLOAD_DIR / ".staging"
+STAGING_DIR.mkdir(parents=True, exist_ok=True)
+RESUMABLE_UPLOAD_TTL = int(os.environ.get("RESUMABLE_UPLOAD_TTL") or 24 * 3600)
+
+# concurrent WebSocket live-ingest sessions (each holds one ffmpeg process
+# that mostly idles waiting for recorder chunks)
+LIVE_INGEST_MAX_SESSIONS = int(os.environ.get("LIVE_INGEST_MAX_SESSIONS") or 32)
+# a session that sends nothing for this many seconds is dropped, freeing its slot
+LIVE_INGEST_IDLE_TIMEOUT = float(os.environ.get("LIVE_INGEST_IDLE_TIMEOUT") or 30)
+_live_sessions = 0
+
+# WAVs up to this size are sent inline in the generate_content request instead
+# of a separate files.upload round trip (inline requests are capped at ~20 MB,
+# and base64 adds a third)
+GENAI_INLINE_MAX_BYTES = int(os.environ.get("GENAI_INLINE_MAX_BYTES") or 8 * 1024 * 1024)
+
+# reuse GenAI file handles for re-analysed WAVs; entries are dropped this many
+# seconds before the remote file expires (GenAI deletes uploads after ~48h)
+GENAI_FILE_EXPIRY_MARGIN = int(os.environ.get("GENAI_FILE_EXPIRY_MARGIN") or 3600)
+GENAI_FILE_DEFAULT_TTL = 48 * 3600
+
+# model used for analysis
+GENAI_MODEL = os.environ.get("GENAI_MODEL") or "gemini-2.5-flash"
+
+# ask GenAI for application/json constrained by ANALYSIS_RESPONSE_SCHEMA, so
+# the parse-failure retry almost never fires; "0" restores free-form text
+GENAI_STRUCTURED_OUTPUT = os.environ.get("GENAI_STRUCTURED_OUTPUT", "1").lower() not in ("0", "false", "no")
+
+# outbound GenAI limits shared by upload and generation calls: max concurrent
+# calls, requests/minute and (estimated) tokens/minute; 0 disables a bucket.
+# Callers queue for up to GENAI_WAIT_TIMEOUT seconds, then get a 429.
+GENAI_MAX_INFLIGHT = int(os.environ.get("GENAI_MAX_INFLIGHT") or 16)
+GENAI_RPM = int(os.environ.get("GENAI_RPM") or 0)
+GENAI_TPM = int(os.environ.get("GENAI_TPM") or 0)
+GENAI_WAIT_TIMEOUT = float(os.environ.get("GENAI_WAIT_TIMEOUT") or 30)
+# token estimate for a generation call: audio is billed at ~32 tokens/second,
+# plus the prompt (~4 chars/token) and room for the JSON answer
+GENAI_AUDIO_TOKENS_PER_SECOND = 32
+GENAI_OUTPUT_TOKEN_ESTIMATE = 1024
+
+# retries for transient GenAI failures: up to GENAI_RETRY_ATTEMPTS tries per
+# call with exponential backoff (base * 2^n, capped) and full jitter
+GENAI_RETRY_ATTEMPTS = int(os.environ.get("GENAI_RETRY_ATTEMPTS") or 3)
+GENAI_RETRY_BASE_DELAY = float(os.environ.get("GENAI_RETRY_BASE_DELAY") or 0.5)
+GENAI_RETRY_MAX_DELAY = float(os.environ.get("GENAI_RETRY_MAX_DELAY") or 8)
+GENAI_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# hedged generation: if a generate_content call is still running after the
+# GENAI_HEDGE_PERCENTILE latency of recent calls, fire a second one and take
+# whichever finishes first (off by default; costs an extra call when it fires)
+GENAI_HEDGE = os.environ.get("GENAI_HEDGE", "0").lower() in ("1", "true", "yes")
+GENAI_HEDGE_PERCENTILE = float(os.environ.get("GENAI_HEDGE_PERCENTILE") or 95)
+GENAI_HEDGE_MIN_SAMPLES = int(os.environ.get("GENAI_HEDGE_MIN_SAMPLES") or 20)
+
+# circuit breaker around GenAI: opens when at least GENAI_BREAKER_MIN_CALLS of
+# the last GENAI_BREAKER_WINDOW calls ended and GENAI_BREAKER_ERROR_RATE of them
+# failed; fails fast for GENAI_BREAKER_COOLDOWN seconds, then lets
+# GENAI_BREAKER_HALF_OPEN_CALLS trial calls through before closing again.
+# While open, analysis returns a degraded local result instead of a 500.
+GENAI_BREAKER_WINDOW = int(os.environ.get("GENAI_BREAKER_WINDOW") or 20)
+GENAI_BREAKER_MIN_CALLS = int(os.environ.get("GENAI_BREAKER_MIN_CALLS") or 10)
+GENAI_BREAKER_ERROR_RATE = float(os.environ.get("GENAI_BREAKER_ERROR_RATE") or 0.5)
+GENAI_BREAKER_COOLDOWN = float(os.environ.get("GENAI_BREAKER_COOLDOWN") or 30)
+GENAI_BREAKER_HALF_OPEN_CALLS = int(os.environ.get("GENAI_BREAKER_HALF_OPEN_CALLS") or 1)
+# local fallback analysis: 20 ms frames quieter than this count as silence;
+# silent gaps inside speech of at least LONG_PAUSE seconds are long pauses
+LOCAL_SILENCE_DBFS = float(os.environ.get("LOCAL_SILENCE_DBFS") or -40)
+LOCAL_PAUSE_SECONDS = 0.3
+LOCAL_LONG_PAUSE_SECONDS = 1.0
+
+# analysis result cache: in-process LRU in front of JSON files in
+# UPLOAD_DIR/.analysis_cache, both bounded by entry count and TTL
+ANALYSIS_CACHE_TTL = int(os.environ.get("ANALYSIS_CACHE_TTL") or 7 * 24 * 3600)
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MEMORY_ENTRIES") or 256)
+ANALYSIS_CACHE_DISK_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_DISK_ENTRIES") or 5000)
+
+# asynchronous analysis jobs: worker pool size, how many submitted jobs may
+# wait for a worker, how long finished jobs stay pollable, and the longest
+# long-poll a GET /api/jobs/{id}?wait=... may hold
+ANALYSIS_JOB_WORKERS = int(os.environ.get("ANALYSIS_JOB_WORKERS") or 4)
+ANALYSIS_JOB_MAX_QUEUE = int(os.environ.get("ANALYSIS_JOB_MAX_QUEUE") or 100)
+ANALYSIS_JOB_TTL = int(os.environ.get("ANALYSIS_JOB_TTL") or 3600)
+ANALYSIS_JOB_MAX_WAIT = float(os.environ.get("ANALYSIS_JOB_MAX_WAIT") or 25)
+# jobs live in the SQLite file ANALYSIS_JOB_DB (default UPLOAD_DIR/.jobs.sqlite3)
+# and are claimed with a lease that the worker renews every LEASE/3 seconds; a
+# job whose lease lapses (worker died) is handed to another worker, and after
+# MAX_ATTEMPTS claims it is dead-lettered. SQLite needs working file locks, so
+# every process using the queue must run on one host; when UPLOAD_DIR is on
+# NFS point ANALYSIS_JOB_DB at local disk.
+ANALYSIS_JOB_DB = os.environ.get("ANALYSIS_JOB_DB") or ""
+ANALYSIS_JOB_LEASE_SECONDS = float(os.environ.get("ANALYSIS_JOB_LEASE_SECONDS") or 60)
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.environ.get("ANALYSIS_JOB_MAX_ATTEMPTS") or 3)
+ANALYSIS_JOB_POLL_INTERVAL = float(os.environ.get("ANALYSIS_JOB_POLL_INTERVAL") or 1.0)
+
+# upload numbers are leased from UPLOAD_DIR/.counter this many at a time, so
+# the counter file is rewritten once per block rather than once per upload
+UPLOAD_ID_BLOCK_SIZE = int(os.environ.get("UPLOAD_ID_BLOCK_SIZE") or 1000)
+
+# how often each conversion path was taken (passthrough, ffmpeg-pipe, ...)
+conversion_path_counts = Counter()
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # resume jobs left in the durable queue by a previous run
+    analysis_jobs.start()
+    yield
+    await analysis_jobs.stop()
+
+
 # FastAPI app
-app = FastAPI(title="Audio Receiver & Converter")
+app = FastAPI(title="Audio Receiver & Converter", lifespan=lifespan)
 
 # CORS (dev) - change for production
 app.add_middleware(
@@ -32,75 +220,347 @@ app.add_middleware(
 )
 
 current_file_name = ""
-# simple incrementing counter for predictable filenames (1,2,3...)
-_file_counter = 0
-_counter_lock = None
 
 
-def _load_counter(counter_path: Path) -> int:
-    try:
-        if counter_path.exists():
-            return int(counter_path.read_text().strip() or 0)
-    except Exception:
-        pass
-    return 0
+class ProcessFileLock:
+    """
+    Exclusive lock across threads and worker processes on the file at `path`:
+    fcntl.flock where available, else the file is created with O_EXCL and
+    removed on release. An O_EXCL lock file older than `stale_seconds` is
+    assumed to belong to a dead holder and taken over.
+    """
 
+    def __init__(self, path: Path, stale_seconds: float = 30.0):
+        self.path = path
+        self.stale_seconds = stale_seconds
 
-def _save_counter(counter_path: Path, value: int) -> None:
-    try:
-        counter_path.write_text(str(value))
-    except Exception:
-        pass
+    @contextlib.contextmanager
+    def hold(self):
+        if fcntl is not None:
+            with open(self.path, "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    seen = os.stat(self.path)
+                except FileNotFoundError:
+                    continue
+                if time.time() - seen.st_mtime > self.stale_seconds:
+                    self._break_stale(seen)
+                    continue
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            mine = os.fstat(fd)
+            os.close(fd)
+            with contextlib.suppress(FileNotFoundError):
+                current = os.stat(self.path)
+                # only remove our own lock file, never one that replaced it after a takeover
+                if (current.st_ino, current.st_dev) == (mine.st_ino, mine.st_dev):
+                    self.path.unlink()
+
+    def _break_stale(self, seen: os.stat_result) -> None:
+        """
+        Remove the lock file `seen` left behind by a dead holder. Renaming is
+        atomic, so only one waiter can move a given file away; the moved file is
+        then checked against `seen`, and a fresh lock taken by another waiter in
+        the meantime is put back instead of being deleted.
+        """
+        grave = self.path.with_name(f"{self.path.name}.{os.getpid()}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(self.path, grave)
+        except FileNotFoundError:
+            return  # another waiter already took it over
+        moved = os.stat(grave)
+        if (moved.st_ino, moved.st_dev) != (seen.st_ino, seen.st_dev):
+            try:
+                os.link(grave, self.path)
+            except FileExistsError:
+                logger.warning("could not restore live lock %s after stale-lock takeover", self.path)
+        else:
+            logger.warning("removed stale lock %s", self.path)
+        os.unlink(grave)
+
+
+class FileCounter:
+    """
+    Upload numbers persisted in `path`, unique across threads and uvicorn
+    worker processes. `path` holds a high-water mark: each process leases the
+    next `block_size` numbers with one read-modify-write of the counter file
+    under a ProcessFileLock on a sibling lock file, then hands them out from
+    memory.
+    Numbers leased by a process that exits are skipped, never reused. The new
+    mark is written to a temp file and renamed over the counter so a crash
+    never leaves it truncated.
+    """
+
+    def __init__(self, path: Path, block_size: int = 1, stale_lock_seconds: float = 30.0):
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.block_size = max(1, block_size)
+        self._lock = ProcessFileLock(self.lock_path, stale_lock_seconds)
+        self._thread_lock = threading.Lock()
+        self._next = 0
+        self._end = 0  # exclusive upper bound of the leased block
+        self._pid = os.getpid()
+        self.leases = 0
+
+    def _read(self) -> int:
+        try:
+            return int(self.path.read_text().strip())
+        except (FileNotFoundError, ValueError):
+            # missing or damaged: continue after the highest number already on disk
+            return max((int(p.stem) for p in self.path.parent.iterdir() if p.stem.isdigit()), default=0)
+
+    def _write(self, value: int) -> None:
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            f.write(str(value))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
 
+    def _lease(self) -> None:
+        with self._lock.hold():
+            start = self._read() + 1
+            self._write(start + self.block_size - 1)
+        self._next, self._end = start, start + self.block_size
+        self._pid = os.getpid()
+        self.leases += 1
 
-def _init_counter():
-    """Initialize module-level counter and lock using UPLOAD_DIR/.counter."""
-    global _file_counter, _counter_lock
-    from threading import Lock
+    def next(self) -> int:
+        with self._thread_lock:
+            # a forked child must not reuse the parent's block
+            if self._next >= self._end or self._pid != os.getpid():
+                self._lease()
+            value = self._next
+            self._next += 1
+            return value
 
-    _counter_lock = Lock()
-    counter_file = UPLOAD_DIR / ".counter"
-    _file_counter = _load_counter(counter_file)
+    def snapshot(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "leases": self.leases,
+            "remaining_in_block": max(0, self._end - self._next),
+        }
+
+
+file_counter = FileCounter(UPLOAD_DIR / ".counter", block_size=UPLOAD_ID_BLOCK_SIZE)
 
 
 def _safe_filename(orig_name: str) -> str:
-    """Generate a sequential filename preserving extension and persist counter.
+    """Generate a sequential filename preserving extension; unique across worker processes."""
+    ext = Path(orig_name).suffix or ".bin"
+    return f"{file_counter.next()}{ext}"
+
 
-    Note: safe for single-process and threads due to the lock. Not safe across
-    multiple processes; for that use a DB or atomic file-based increment.
+async def save_upload_to_disk(file: UploadFile, dest: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
     """
-    global _file_counter, _counter_lock
-    if _counter_lock is None:
-        _init_counter()
+    Copy an UploadFile to dest in fixed-size chunks so memory use stays bounded
+    by chunk_size regardless of recording length. A _StagedFile is already on
+    the same volume, so it is hard-linked to dest instead of copied (the staged
+    copy stays in place until finalize succeeds, so a failed conversion can be
+    retried).
+    Returns {"bytes_written": <int>, "peak_bytes_buffered": <int>}.
+    """
+    if isinstance(file, _StagedFile):
+        try:
+            dest.unlink(missing_ok=True)
+            os.link(file.path, dest)
+            return {"bytes_written": dest.stat().st_size, "peak_bytes_buffered": 0}
+        except OSError:
+            logger.warning("hard link of %s failed, copying instead", file.path, exc_info=True)
+    written = 0
+    peak = 0
+    with open(dest, "wb") as f:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            peak = max(peak, len(chunk))
+            f.write(chunk)
+            written += len(chunk)
+    return {"bytes_written": written, "peak_bytes_buffered": peak}
 
-    counter_file = UPLOAD_DIR / ".counter"
-    ext = Path(orig_name).suffix or ".bin"
-    with _counter_lock:
-        _file_counter += 1
-        _save_counter(counter_file, _file_counter)
-        return f"{_file_counter}{ext}"
 
+class ConversionQueueFull(Exception):
+    """Raised when every conversion slot is busy and the wait queue is full."""
 
-def convert_to_wav(input_path: Path, output_path: Path) -> None:
+    def __init__(self, retry_after: int):
+        super().__init__(f"conversion queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class ConversionScheduler:
     """
-    Run ffmpeg to convert any input audio to WAV (mono, 16k).
-    Raises subprocess.CalledProcessError on failure.
+    Caps the number of concurrent ffmpeg processes and bounds how many requests
+    may wait for one. Callers over the bound are rejected immediately instead of
+    piling up more encoders.
     """
-    cmd = [
+
+    def __init__(self, max_parallel: int, max_queue: int):
+        self.max_parallel = max(1, max_parallel)
+        self.max_queue = max(0, max_queue)
+        self._sem = None  # created lazily inside the running event loop
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _retry_after(self) -> int:
+        # rough time for the queue ahead of the caller to drain
+        avg_run = self.total_run_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(avg_run * (self.waiting + 1) / self.max_parallel))
+
+    def check_admission(self) -> None:
+        """Raise ConversionQueueFull if a new caller would be rejected right now."""
+        if self.running >= self.max_parallel and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ConversionQueueFull(self._retry_after())
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one conversion slot for the duration of the block."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_parallel)
+        self.check_admission()
+        self.waiting += 1
+        queued_at = time.monotonic()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - queued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.running += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.total_run_seconds += time.monotonic() - started
+            self._sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_parallel": self.max_parallel,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.completed, 4) if self.completed else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+            "avg_run_seconds": round(self.total_run_seconds / self.completed, 4) if self.completed else 0.0,
+        }
+
+
+conversion_scheduler = ConversionScheduler(FFMPEG_MAX_PARALLEL, FFMPEG_MAX_QUEUE)
+
+
+def _conversion_busy(e: ConversionQueueFull) -> HTTPException:
+    logger.warning("rejecting upload: %s", e)
+    return HTTPException(
+        status_code=503,
+        detail="Server busy converting audio, retry later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _ffmpeg_wav_cmd(input_arg: str, output_path: Path) -> list:
+    """Build the ffmpeg command line converting input_arg to WAV (mono, 16k)."""
+    return [
         "ffmpeg",
         "-y",                # overwrite
         "-i",
-        str(input_path),
+        input_arg,           # file path, or "pipe:0" for stdin
         "-ac",
         "1",                 # mono
         "-ar",
         "16000",             # 16 kHz
         "-vn",               # drop video if present
+        "-f",
+        "wav",               # explicit, so output may be staged under a .part name
         str(output_path),
     ]
+
+
+def convert_to_wav(input_path: Path, output_path: Path) -> None:
+    """
+    Run ffmpeg to convert any input audio to WAV (mono, 16k).
+    Raises subprocess.CalledProcessError on failure.
+    """
+    cmd = _ffmpeg_wav_cmd(str(input_path), output_path)
     subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
+async def convert_to_wav_async(input_path: Path, output_path: Path) -> None:
+    """
+    Non-blocking variant of convert_to_wav for use from request handlers: the
+    event loop keeps serving other requests while ffmpeg runs.
+    Raises subprocess.CalledProcessError on failure.
+    """
+    cmd = _ffmpeg_wav_cmd(str(input_path), output_path)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    returncode = await proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+async def convert_upload_to_wav_piped(file: UploadFile, output_path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+    """
+    Feed the upload to ffmpeg over stdin (-i pipe:0) chunk by chunk, so only the
+    converted WAV touches UPLOAD_DIR. Writes are awaited, so a slow ffmpeg
+    applies backpressure without blocking the event loop.
+    Raises subprocess.CalledProcessError on failure.
+    Returns {"bytes_written": <int>, "peak_bytes_buffered": <int>}.
+    """
+    cmd = _ffmpeg_wav_cmd("pipe:0", output_path)
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    written = 0
+    peak = 0
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            peak = max(peak, len(chunk))
+            try:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # ffmpeg gave up on the input; its exit code reports why
+                break
+            written += len(chunk)
+    finally:
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        returncode = await proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return {"bytes_written": written, "peak_bytes_buffered": peak}
+
+
 def get_wav_duration_seconds(wav_path: Path) -> float:
     """Return duration in seconds using wave module (works for PCM WAV)."""
     with wave.open(str(wav_path), "rb") as wf:
@@ -111,6 +571,331 @@ def get_wav_duration_seconds(wav_path: Path) -> float:
         return frames / float(rate)
 
 
+def sniff_wav_format(head: bytes):
+    """
+    Parse a WAV header from the first bytes of an upload.
+    Returns (channels, sample rate, sample width, compression) or None if the
+    bytes are not a PCM WAV header the wave module understands.
+    """
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    try:
+        with wave.open(io.BytesIO(head), "rb") as wf:
+            return (wf.getnchannels(), wf.getframerate(), wf.getsampwidth(), wf.getcomptype())
+    except (wave.Error, EOFError):
+        return None
+
+
+def _pcm_to_float_mono(frames: bytes, sampwidth: int, channels: int) -> "np.ndarray":
+    """Decode little-endian PCM frames to float32 in [-1, 1) and average channels."""
+    if sampwidth == 1:
+        x = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        x = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        b = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        v = np.where(v >= 1 << 23, v - (1 << 24), v)
+        x = v.astype(np.float32) / float(1 << 23)
+    elif sampwidth == 4:
+        x = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"unsupported sample width: {sampwidth}")
+    if channels > 1:
+        x = x[: len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1)
+    return x
+
+
+@lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int, half_taps_per_phase: int = 10):
+    """
+    Kaiser-windowed sinc low-pass for resampling by up/down, split into `up`
+    polyphase branches. Returns (filter bank of shape (up, taps), group delay).
+    """
+    max_rate = max(up, down)
+    cutoff = 1.0 / max_rate  # fraction of the upsampled Nyquist
+    half_len = half_taps_per_phase * max_rate
+    n = np.arange(-half_len, half_len + 1)
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), 5.0) * up
+    taps = -(-len(h) // up)
+    h = np.concatenate([h, np.zeros(taps * up - len(h))])
+    return h.reshape(taps, up).T.astype(np.float32), half_len
+
+
+def resample_poly_blocks(blocks, up: int, down: int):
+    """
+    Streaming polyphase FIR resampler by up/down: consumes an iterable of
+    float32 input blocks and yields output blocks as soon as the input they
+    depend on has arrived. Only the last `taps` input samples are carried
+    between blocks, so memory does not grow with the signal length. Each output
+    sample only evaluates the filter branch that lines up with real input
+    samples, instead of filtering the zero-stuffed upsampled signal.
+    """
+    bank, delay = _polyphase_filter(up, down)
+    taps = bank.shape[1]
+    k = np.arange(taps)
+    buf = np.zeros(taps, np.float32)  # input samples buf_start.. (leading zero padding)
+    buf_start = -taps
+    consumed = 0
+    n = 0  # next output sample
+    blocks = iter(blocks)
+    done = False
+    while not done:
+        x = next(blocks, None)
+        if x is None:
+            # end of input: zero padding after it, then every remaining output
+            done = True
+            buf = np.concatenate([buf, np.zeros(taps, np.float32)])
+            n_stop = -(-consumed * up // down)
+        else:
+            if len(x) == 0:
+                continue
+            buf = np.concatenate([buf, x.astype(np.float32, copy=False)])
+            consumed += len(x)
+            # outputs whose newest input sample, (n*down + delay) // up, has arrived
+            n_stop = max(n, -(-(consumed * up - delay) // down))
+        for start in range(n, n_stop, PCM_RESAMPLE_BLOCK):
+            idx = np.arange(start, min(start + PCM_RESAMPLE_BLOCK, n_stop))
+            pos = idx * down + delay  # position in the (virtual) upsampled signal
+            base, phase = np.divmod(pos, up)
+            window = buf[base[:, None] - k[None, :] - buf_start]
+            yield np.einsum("ij,ij->i", window, bank[phase])
+        n = n_stop
+        # keep only what the next output can still reach back to
+        drop = max(0, (n * down + delay) // up - taps + 1 - buf_start)
+        buf = buf[drop:]
+        buf_start += drop
+
+
+def resample_poly(x: "np.ndarray", up: int, down: int) -> "np.ndarray":
+    """Resample a whole array by up/down (see resample_poly_blocks)."""
+    if up == down:
+        return x.astype(np.float32, copy=False)
+    out = list(resample_poly_blocks([x], up, down))
+    return np.concatenate(out) if out else np.zeros(0, np.float32)
+
+
+def pcm_resample_supported(wav_format) -> bool:
+    """True if the numpy converter can handle a sniffed WAV format."""
+    if np is None or PCM_CONVERTER != "numpy" or wav_format is None:
+        return False
+    channels, rate, sampwidth, comptype = wav_format
+    if comptype != "NONE" or sampwidth not in (1, 2, 3, 4) or channels < 1 or rate <= 0:
+        return False
+    target_rate = TARGET_WAV_FORMAT[1]
+    g = math.gcd(target_rate, rate)
+    return max(target_rate // g, rate // g) <= PCM_MAX_RESAMPLE_FACTOR
+
+
+def resample_pcm_wav(input_path: Path, output_path: Path) -> None:
+    """
+    Downmix and resample a PCM WAV to WAV (mono, 16k) in-process with numpy,
+    PCM_READ_FRAMES input frames at a time, so memory use is bounded
+    regardless of the recording's length.
+    Raises ValueError for formats pcm_resample_supported rejects.
+    """
+    with wave.open(str(input_path), "rb") as wf:
+        wav_format = (wf.getnchannels(), wf.getframerate(), wf.getsampwidth(), wf.getcomptype())
+        if not pcm_resample_supported(wav_format):
+            raise ValueError(f"unsupported WAV format for in-process resampling: {wav_format}")
+        channels, rate, sampwidth, _ = wav_format
+        target_rate = TARGET_WAV_FORMAT[1]
+        g = math.gcd(target_rate, rate)
+
+        def read_blocks():
+            while True:
+                frames = wf.readframes(PCM_READ_FRAMES)
+                if not frames:
+                    return
+                yield _pcm_to_float_mono(frames, sampwidth, channels)
+
+        with wave.open(str(output_path), "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(target_rate)
+            if target_rate == rate:
+                blocks = read_blocks()  # downmix / sample width change only
+            else:
+                blocks = resample_poly_blocks(read_blocks(), target_rate // g, rate // g)
+            for y in blocks:
+                pcm = np.clip(np.round(y * 32768.0), -32768, 32767).astype("<i2")
+                out.writeframes(pcm.tobytes())
+
+
+def decode_to_wav_pyav(input_path: Path, output_path: Path) -> None:
+    """
+    Decode any libav-readable input in-process and write WAV (mono, 16k).
+    PyAV drops the GIL while libav decodes/resamples, so this is meant to run
+    in a worker thread.
+    """
+    _, target_rate, sampwidth, _ = TARGET_WAV_FORMAT
+    with av.open(str(input_path)) as container:
+        stream = next((st for st in container.streams if st.type == "audio"), None)
+        if stream is None:
+            raise ValueError("input has no audio stream")
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=target_rate)
+        with wave.open(str(output_path), "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(sampwidth)
+            out.setframerate(target_rate)
+
+            def write(frames):
+                for rf in frames:
+                    # packed mono s16: plane 0 holds samples * 2 bytes (plus padding)
+                    out.writeframes(bytes(rf.planes[0])[: rf.samples * sampwidth])
+
+            for frame in container.decode(stream):
+                write(resampler.resample(frame))
+            write(resampler.resample(None))  # flush
+
+
+class FfmpegCliConverter:
+    """Fork the ffmpeg binary per conversion; can also consume the upload over a pipe."""
+
+    name = "ffmpeg"
+    supports_pipe = True
+
+    async def convert(self, input_path: Path, output_path: Path) -> None:
+        await convert_to_wav_async(input_path, output_path)
+
+    async def convert_upload(self, file: UploadFile, output_path: Path) -> dict:
+        return await convert_upload_to_wav_piped(file, output_path)
+
+
+class PyAVConverter:
+    """Decode with libav inside the worker process (no fork/exec per upload)."""
+
+    name = "pyav"
+    supports_pipe = False
+
+    async def convert(self, input_path: Path, output_path: Path) -> None:
+        await asyncio.to_thread(decode_to_wav_pyav, input_path, output_path)
+
+
+class NumpyPcmConverter:
+    """Downmix/resample PCM WAV in-process; see pcm_resample_supported."""
+
+    name = "numpy"
+    supports_pipe = False
+
+    async def convert(self, input_path: Path, output_path: Path) -> None:
+        await asyncio.to_thread(resample_pcm_wav, input_path, output_path)
+
+
+def _select_converter():
+    if AUDIO_CONVERTER == "pyav":
+        if av is not None:
+            return PyAVConverter()
+        logger.warning("AUDIO_CONVERTER=pyav but PyAV is not installed; using the ffmpeg CLI")
+    elif AUDIO_CONVERTER != "ffmpeg":
+        logger.warning("unknown AUDIO_CONVERTER=%r; using the ffmpeg CLI", AUDIO_CONVERTER)
+    return FfmpegCliConverter()
+
+
+audio_converter = _select_converter()
+pcm_converter = NumpyPcmConverter()
+
+
+class DedupIndex:
+    """
+    Maps SHA-256 of uploaded bytes -> converted WAV metadata. Persisted as an
+    append-only JSON-lines file in UPLOAD_DIR so it survives restarts; later
+    lines win. Entries whose WAV has been deleted are ignored. Lines appended
+    by other worker processes are picked up on a miss. `inflight` maps hashes
+    currently being converted in this process to an Event set when done.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries = None
+        self._offset = 0  # bytes of the file already read
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.inflight_waits = 0
+
+    def _read_new_lines(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # another process is mid-append; read it next time
+                    self._offset += len(line)
+                    try:
+                        rec = json.loads(line)
+                        self._entries[rec["sha256"]] = rec
+                    except (ValueError, KeyError):
+                        continue  # torn/corrupt line from a crash
+        except FileNotFoundError:
+            pass
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            self._read_new_lines()
+        return self._entries
+
+    def _lookup(self, sha256: str):
+        rec = self._load().get(sha256)
+        if rec is not None and (UPLOAD_DIR / rec["wav_filename"]).exists():
+            return rec
+        return None
+
+    def get(self, sha256: str):
+        rec = self._lookup(sha256)
+        if rec is None:
+            # another worker may have converted it since we last read the file
+            self._read_new_lines()
+            rec = self._lookup(sha256)
+        if rec is not None:
+            self.hits += 1
+            return rec
+        self.misses += 1
+        return None
+
+    def put(self, sha256: str, wav_filename: str, duration_seconds) -> None:
+        rec = {"sha256": sha256, "wav_filename": wav_filename, "duration_seconds": duration_seconds}
+        self._load()[sha256] = rec
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+        except Exception:
+            logger.exception("failed to persist dedup index entry")
+
+    def snapshot(self) -> dict:
+        return {
+            "entries": len(self._load()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "inflight": len(self.inflight),
+            "inflight_waits": self.inflight_waits,
+        }
+
+
+dedup_index = DedupIndex(UPLOAD_DIR / ".dedup_index.jsonl")
+
+
+async def hash_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> dict:
+    """
+    SHA-256 of an UploadFile, read in bounded chunks; rewinds the file afterwards.
+    Returns {"sha256": <hex>, "bytes_written": <int>, "peak_bytes_buffered": <int>}.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    peak = 0
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        peak = max(peak, len(chunk))
+    await file.seek(0)
+    return {"sha256": digest.hexdigest(), "bytes_written": size, "peak_bytes_buffered": peak}
+
+
 @app.post("/api/upload-audio")
 async def upload_audio(file: UploadFile = File(...)):
     """
@@ -119,193 +904,2143 @@ async def upload_audio(file: UploadFile = File(...)):
     """
     if not file or not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded")
+    return await ingest_upload(file, file.filename)
 
-    # Save incoming file to UPLOAD_DIR
-    in_filename = _safe_filename(file.filename)
-    in_path = UPLOAD_DIR / in_filename
+
+async def ingest_upload(file, orig_name: str) -> dict:
+    """
+    Store and convert one upload; shared by all ingest endpoints.
+    `file` needs async read(size) and seek(offset) (an UploadFile or _StagedFile).
+    Returns the /api/upload-audio response body; raises HTTPException on failure.
+    """
+    if not UPLOAD_DEDUP:
+        return await convert_upload(file, orig_name, None)
+
+    # Same bytes already converted (retry / double submit)? Hand back that WAV.
+    hashed = await hash_upload(file)
+    sha256 = hashed["sha256"]
+    while True:
+        existing = dedup_index.get(sha256)
+        if existing is not None:
+            conversion_path_counts["dedup"] += 1
+            return {
+                "status": "ok",
+                "wav_filename": existing["wav_filename"],
+                "wav_path": str(UPLOAD_DIR / existing["wav_filename"]),
+                "duration_seconds": existing["duration_seconds"],
+                "bytes_received": hashed["bytes_written"],
+                "peak_bytes_buffered": hashed["peak_bytes_buffered"],
+                "conversion": "dedup",
+                "message": "Identical upload already converted. Proceed with transcription/analysis."
+            }
+        pending = dedup_index.inflight.get(sha256)
+        if pending is None:
+            break
+        # the same bytes are being converted right now (double click): wait for
+        # that conversion instead of running a second one; if it fails, go ahead
+        dedup_index.inflight_waits += 1
+        await pending.wait()
+
+    done = asyncio.Event()
+    dedup_index.inflight[sha256] = done
     try:
-        contents = await file.read()
-        with open(in_path, "wb") as f:
-            f.write(contents)
-    except Exception as e:
-        # cleanup if write failed
+        return await convert_upload(file, orig_name, sha256)
+    finally:
+        del dedup_index.inflight[sha256]
+        done.set()
+
+
+def is_pipeable_upload(ext: str, head: bytes) -> bool:
+    """
+    True if ffmpeg can decode the upload from stdin. The extension is only the
+    client's claim (the frontend names every recording answer.webm), so MP4/M4A
+    content, sniffed by its "ftyp" box, always goes through a file: its index
+    may sit at the end and ffmpeg has to seek to it.
+    """
+    return ext.lower() in PIPEABLE_EXTS and head[4:8] != b"ftyp"
+
+
+async def convert_upload(file, orig_name: str, sha256) -> dict:
+    """
+    Convert one upload to UPLOAD_DIR/<n>.wav by the cheapest applicable path and
+    record it in the dedup index under `sha256` (None to skip).
+    Returns the /api/upload-audio response body; raises HTTPException on failure.
+    """
+    head = await file.read(WAV_SNIFF_BYTES)
+    await file.seek(0)
+    wav_format = sniff_wav_format(head)
+
+    if wav_format != TARGET_WAV_FORMAT:
+        # fail fast before reading the body if the conversion pool is saturated
         try:
-            if in_path.exists():
-                in_path.unlink()
-        except: pass
-        raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {e}")
+            conversion_scheduler.check_admission()
+        except ConversionQueueFull as e:
+            raise _conversion_busy(e)
 
-    # Convert to WAV
+    in_filename = _safe_filename(orig_name)
+    in_path = UPLOAD_DIR / in_filename
     out_filename = f"{in_path.stem}.wav"
     # expose the current file name for other handlers if needed
     current_file_name = out_filename
     out_path = UPLOAD_DIR / out_filename
-    try:
-        convert_to_wav(in_path, out_path)
-    except subprocess.CalledProcessError as e:
-        # cleanup input file
+    if in_path == out_path:
+        # .wav upload that still needs converting: don't let ffmpeg overwrite its input
+        in_path = UPLOAD_DIR / f"{in_path.stem}.part"
+
+    if wav_format == TARGET_WAV_FORMAT:
+        # Already 16 kHz mono 16-bit PCM: no ffmpeg, just move it into place.
+        # Stage under a name /api/list and the analyzer never pick up.
+        part_path = UPLOAD_DIR / f"{out_path.stem}.part"
         try:
-            in_path.unlink()
-        except: pass
-        raise HTTPException(status_code=500, detail="ffmpeg conversion failed")
-    except Exception as e:
+            ingest = await save_upload_to_disk(file, part_path)
+            os.replace(part_path, out_path)
+        except Exception as e:
+            try:
+                part_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {e}")
+        conversion = "passthrough"
+    elif pcm_resample_supported(wav_format):
+        # PCM at another rate/layout: resample in-process rather than fork ffmpeg
+        part_path = UPLOAD_DIR / f"{out_path.stem}.part"
+        try:
+            ingest = await save_upload_to_disk(file, part_path)
+            async with conversion_scheduler.slot():
+                await pcm_converter.convert(part_path, out_path)
+        except ConversionQueueFull as e:
+            raise _conversion_busy(e)
+        except Exception as e:
+            try:
+                out_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            raise HTTPException(status_code=500, detail=f"Conversion error: {e}")
+        finally:
+            try:
+                part_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+        conversion = pcm_converter.name
+    elif audio_converter.supports_pipe and STREAM_CONVERT and is_pipeable_upload(in_path.suffix, head):
+        # Stream straight into ffmpeg; no intermediate input file on disk
+        try:
+            async with conversion_scheduler.slot():
+                ingest = await audio_converter.convert_upload(file, out_path)
+        except ConversionQueueFull as e:
+            raise _conversion_busy(e)
+        except subprocess.CalledProcessError:
+            try:
+                out_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            raise HTTPException(status_code=500, detail="ffmpeg conversion failed")
+        except Exception as e:
+            try:
+                out_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            raise HTTPException(status_code=500, detail=f"Conversion error: {e}")
+        conversion = f"{audio_converter.name}-pipe"
+    else:
+        # Save incoming file to UPLOAD_DIR
+        try:
+            ingest = await save_upload_to_disk(file, in_path)
+        except Exception as e:
+            # cleanup if write failed
+            try:
+                if in_path.exists():
+                    in_path.unlink()
+            except: pass
+            raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {e}")
+
+        # Convert to WAV
+        try:
+            async with conversion_scheduler.slot():
+                await audio_converter.convert(in_path, out_path)
+        except ConversionQueueFull as e:
+            try:
+                in_path.unlink()
+            except: pass
+            raise _conversion_busy(e)
+        except subprocess.CalledProcessError:
+            # cleanup input file
+            try:
+                in_path.unlink()
+            except: pass
+            raise HTTPException(status_code=500, detail="ffmpeg conversion failed")
+        except Exception as e:
+            try:
+                in_path.unlink()
+                out_path.unlink(missing_ok=True)  # in-process decoders may leave a partial WAV
+            except: pass
+            raise HTTPException(status_code=500, detail=f"Conversion error: {e}")
+
+        # (Optional) Keep both files for later processing. If you want to remove input:
         try:
-            in_path.unlink()
-        except: pass
-        raise HTTPException(status_code=500, detail=f"Conversion error: {e}")
+            in_path.unlink()  # remove original uploaded file to save space
+        except Exception:
+            pass
+        conversion = f"{audio_converter.name}-file"
+
+    conversion_path_counts[conversion] += 1
 
     # Get duration (seconds)
     try:
         duration = get_wav_duration_seconds(out_path)
     except Exception:
         duration = None
+    duration = None if duration is None else round(duration, 3)
 
-    # (Optional) Keep both files for later processing. If you want to remove input:
-    try:
-        in_path.unlink()  # remove original uploaded file to save space
-    except Exception:
-        pass
+    if sha256 is not None:
+        dedup_index.put(sha256, out_filename, duration)
 
     # Return relative filename and metadata — backend will use the file for further processing
     return {
         "status": "ok",
         "wav_filename": out_filename,
         "wav_path": str(out_path),   # you can remove this if you don't want to expose paths
-        "duration_seconds": None if duration is None else round(duration, 3),
+        "duration_seconds": duration,
+        "bytes_received": ingest["bytes_written"],
+        "peak_bytes_buffered": ingest["peak_bytes_buffered"],
+        "conversion": conversion,
         "message": "File converted to WAV (mono, 16k). Proceed with transcription/analysis."
     }
 
 
-@app.post("/api/analyze_with_genai")
-async def analyze_with_genai(payload: Request):
+class _StagedFile:
     """
-    Expects JSON body: {"wav_filename": "<name.wav>", "keywords": ["k1","k2"]} (keywords optional)
-    Uploads WAV to Google GenAI, asks for a strict JSON response containing transcript + scores,
-    validates/parses the model output, and returns the parsed JSON to the client.
+    Async read/seek over a file on disk, so staged uploads can go through
+    ingest_upload. Reads run in a worker thread so large (or NFS-backed) staged
+    files don't stall the event loop.
     """
-    body = await payload.json()
-    wav_filename = body.get("wav_filename")
-    keywords = body.get("keywords") or []
-    # If wav_filename not supplied, pick the most recently modified .wav in UPLOAD_DIR
-    if not wav_filename:
-        wavs = sorted(UPLOAD_DIR.glob("*.wav"), key=lambda p: p.stat().st_mtime, reverse=True)
-        if not wavs:
-            raise HTTPException(status_code=404, detail="no wav files available")
-        wav_path = wavs[0]
-        wav_filename = wav_path.name
-    else:
-        wav_path = UPLOAD_DIR / wav_filename
-        if not wav_path.exists():
-            raise HTTPException(status_code=404, detail="wav file not found")
 
-    # Upload file to GenAI
-    try:
-        uploaded = client.files.upload(file=str(wav_path))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"GenAI file upload failed: {e}")
-
-    # Build the prompt with optional keywords
-    base_prompt = (
-        "You are an assistant that transcribes an audio clip and rates the speaker with objective numeric scores.\n"
-        "Output MUST be valid JSON and nothing else. Follow this JSON schema exactly:\n"
-        "{\n"
-        "  \"transcript\": \"<string>\",\n"
-        "  \"scores\": {\n"
-        "    \"overall\": \"<0-100>\",\n"
-        "    \"fluency\": \"<0-100>\",\n"
-        "    \"confidence\": \"<0-100> (INTEGER, required)\",\n"
-        "    \"filler\": \"<0-100>\",\n"
-        "    \"filler_rate_per_min\": \"<float> (required, decimals allowed)\",\n"
-        "    \"tone\": \"<neutral|positive|negative|anxious|angry|happy>\",\n"
-        "    \"keyword_coverage_pct\": \"<0-100|null>\"\n"
-        "  },\n"
-        "  \"counts\": {\n"
-        "    \"total_words\": \"<int>\",\n"
-        "    \"total_fillers\": \"<int>\",\n"
-        "    \"long_pauses\": \"<int>\"\n"
-        "  },\n"
-        "  \"suggestions\": [\"<short suggestion strings>\"]\n"
-        "}\n"
-        "REQUIREMENTS:\n"
-        "- \"confidence\" MUST be an integer between 0 and 100. Do not return null.\n"
-        "- \"filler_rate_per_min\" MUST be a numeric value (decimals allowed) representing estimated filler words per minute. Do not return null.\n"
-        "- Count filler words as occurrences of: \"um\", \"uh\", \"like\" (when used as a filler), \"you know\", \"I mean\". Do NOT count words used with clear semantic meaning.\n"
-        "- \"total_fillers\" should be the integer count of detected filler occurrences in the transcript.\n"
-        "- If you cannot determine a metric, estimate conservatively rather than returning null for confidence/filler_rate_per_min.\n"
-        "Provide integers for 0-100 scores; use one decimal place for filler_rate_per_min when appropriate.\n"
-    )
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = open(path, "rb")
 
-    if keywords:
-        base_prompt += "Keywords to check for coverage: " + ", ".join(keywords) + "\n"
+    async def read(self, size: int = -1) -> bytes:
+        return await asyncio.to_thread(self._f.read, size)
 
-    # Call the model
-    try:
-        resp = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[base_prompt, uploaded],
-            
-        )
-        raw_text = getattr(resp, "text", None) or (resp.get("text") if isinstance(resp, dict) else str(resp))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"GenAI generation failed: {e}")
+    async def seek(self, offset: int) -> None:
+        self._f.seek(offset)
 
-    # helper to parse JSON out of model output
-    def try_parse(s: str):
-        if not s:
-            return None
-        s = s.strip()
-        # strip triple-backticks if present
-        if s.startswith("```") and s.endswith("```"):
-            s = "\n".join(s.splitlines()[1:-1])
-        try:
-            return json.loads(s)
-        except Exception:
-            start = s.find('{')
-            end = s.rfind('}')
-            if start != -1 and end != -1 and end > start:
-                try:
-                    return json.loads(s[start:end+1])
-                except Exception:
-                    return None
-            return None
+    def close(self) -> None:
+        self._f.close()
 
-    parsed = try_parse(raw_text)
 
-    # retry once with a stricter instruction if parsing failed
-    if parsed is None:
-        retry_prompt = "ONLY OUTPUT A SINGLE JSON OBJECT following the schema. Do not add ANY explanatory text."
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+# serializes chunk appends per session (within this process)
+_upload_locks = {}
+
+
+def _staging_paths(upload_id: str):
+    """Return (data path, metadata path) for a resumable upload session, or 404."""
+    if not _UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=404, detail="upload session not found")
+    part = STAGING_DIR / f"{upload_id}.part"
+    meta = STAGING_DIR / f"{upload_id}.json"
+    if not meta.exists():
+        raise HTTPException(status_code=404, detail="upload session not found")
+    return part, meta
+
+
+def _purge_stale_uploads() -> None:
+    cutoff = time.time() - RESUMABLE_UPLOAD_TTL
+    for meta in STAGING_DIR.glob("*.json"):
         try:
-            resp2 = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[retry_prompt, base_prompt, uploaded],
-            )
-            raw_text2 = getattr(resp2, "text", None) or (resp2.get("text") if isinstance(resp2, dict) else str(resp2))
-            parsed = try_parse(raw_text2)
-            if parsed is not None:
-                raw_text = raw_text2
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"GenAI retry failed: {e}")
+            part = meta.with_suffix(".part")
+            last = part.stat().st_mtime if part.exists() else meta.stat().st_mtime
+            if last < cutoff:
+                part.unlink(missing_ok=True)
+                meta.unlink(missing_ok=True)
+                _upload_locks.pop(meta.stem, None)
+        except Exception:
+            pass
+    # sessions removed elsewhere (another worker, or abandoned and purged there)
+    for upload_id, lock in list(_upload_locks.items()):
+        if not lock.locked() and not (STAGING_DIR / f"{upload_id}.json").exists():
+            _upload_locks.pop(upload_id, None)
 
-    if parsed is None:
-        # return raw model output for debugging
-        return {"status": "error", "message": "Model did not return valid JSON", "raw": raw_text}
 
-    # basic normalization: cast numeric score fields if possible
+@app.post("/api/uploads")
+async def create_upload_session(payload: Request):
+    """
+    Start a resumable upload. Optional JSON body: {"filename": "answer.webm"}.
+    Returns {"upload_id": "<id>", "offset": 0}; then PUT chunks to
+    /api/uploads/<id>?offset=<n> and POST /api/uploads/<id>/finalize.
+    """
     try:
-        scores = parsed.get("scores", {})
-        for key in ["fluency", "confidence", "keyword_coverage_pct"]:
-            val = scores.get(key)
-            if val is not None:
-                scores[key] = int(float(val))
-        parsed["scores"] = scores
+        body = await payload.json()
     except Exception:
-        pass
+        body = {}
+    if body is None:
+        body = {}
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="body must be a JSON object")
+    filename = body.get("filename") or "upload.webm"
+    if not isinstance(filename, str):
+        raise HTTPException(status_code=400, detail="filename must be a string")
+    _purge_stale_uploads()
+    upload_id = uuid.uuid4().hex
+    (STAGING_DIR / f"{upload_id}.part").touch()
+    (STAGING_DIR / f"{upload_id}.json").write_text(json.dumps({"filename": filename, "created": time.time()}))
+    return {"upload_id": upload_id, "offset": 0}
 
-    return {"status": "ok", "result": parsed, "raw_text": raw_text}
+
+@app.get("/api/uploads/{upload_id}")
+def get_upload_session(upload_id: str):
+    """Committed byte offset of a resumable upload: resume sending from here."""
+    part, meta = _staging_paths(upload_id)
+    return {"upload_id": upload_id, "offset": part.stat().st_size if part.exists() else 0}
+
+
+@app.put("/api/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(...)):
+    """
+    Append the raw request body at `offset`, which must equal the committed
+    offset (409 with the current offset otherwise). Bytes are committed as they
+    arrive, so an interrupted PUT can be resumed from GET /api/uploads/<id>.
+    """
+    part, meta = _staging_paths(upload_id)
+    lock = _upload_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        committed = part.stat().st_size if part.exists() else 0
+        if offset != committed:
+            raise HTTPException(status_code=409, detail={"message": "offset mismatch", "offset": committed})
+        with open(part, "ab") as f:
+            try:
+                async for chunk in request.stream():
+                    if chunk:
+                        f.write(chunk)
+                        committed += len(chunk)
+            finally:
+                f.flush()
+    return {"upload_id": upload_id, "offset": committed}
+
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload_session(upload_id: str):
+    """Convert the staged upload; returns the same metadata as /api/upload-audio."""
+    part, meta = _staging_paths(upload_id)
+    lock = _upload_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        if not part.exists() or part.stat().st_size == 0:
+            raise HTTPException(status_code=400, detail="No data uploaded")
+        filename = json.loads(meta.read_text()).get("filename") or "upload.webm"
+        staged = _StagedFile(part)
+        try:
+            result = await ingest_upload(staged, filename)
+        finally:
+            staged.close()
+        part.unlink(missing_ok=True)
+        meta.unlink(missing_ok=True)
+    _upload_locks.pop(upload_id, None)
+    return {**result, "upload_id": upload_id}
+
+
+@app.delete("/api/uploads/{upload_id}")
+def abort_upload_session(upload_id: str):
+    """Discard a resumable upload and its staged bytes."""
+    part, meta = _staging_paths(upload_id)
+    part.unlink(missing_ok=True)
+    meta.unlink(missing_ok=True)
+    _upload_locks.pop(upload_id, None)
+    return {"status": "ok", "upload_id": upload_id}
+
+
+@app.websocket("/api/ws/live-ingest")
+async def live_ingest(ws: WebSocket):
+    """
+    Live recording ingest. Send MediaRecorder timeslice chunks as binary
+    messages while recording; they are fed to a long-lived ffmpeg process as
+    they arrive. Send the text message "stop" (or {"type": "stop"}) when the
+    recorder stops: the server finishes the WAV and replies with the same JSON
+    /api/upload-audio returns, then closes the socket.
+    """
+    global _live_sessions
+    await ws.accept()
+    if _live_sessions >= LIVE_INGEST_MAX_SESSIONS:
+        await ws.send_json({"status": "error", "detail": "Server busy, retry later"})
+        await ws.close(code=1013)  # try again later
+        return
+
+    _live_sessions += 1
+    proc = None
+    part_path = None
+    try:
+        out_filename = f"{Path(_safe_filename('live.webm')).stem}.wav"
+        out_path = UPLOAD_DIR / out_filename
+        # ffmpeg writes the growing file under a name /api/list and the analyzer never pick up
+        part_path = UPLOAD_DIR / f"{out_path.stem}.part"
+        cmd = _ffmpeg_wav_cmd("pipe:0", part_path)
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        digest = hashlib.sha256()
+        received = 0
+        peak = 0
+        stopped = False
+        while not stopped:
+            try:
+                msg = await asyncio.wait_for(ws.receive(), timeout=LIVE_INGEST_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("dropping idle live ingest session after %ss", LIVE_INGEST_IDLE_TIMEOUT)
+                proc.kill()
+                await proc.wait()
+                part_path.unlink(missing_ok=True)
+                await ws.send_json({"status": "error", "detail": "No data received, session closed"})
+                await ws.close(code=1001)
+                return
+            if msg["type"] == "websocket.disconnect":
+                # client went away mid-recording: nothing to return the WAV to
+                proc.kill()
+                await proc.wait()
+                part_path.unlink(missing_ok=True)
+                return
+            data = msg.get("bytes")
+            if data:
+                digest.update(data)
+                received += len(data)
+                peak = max(peak, len(data))
+                try:
+                    proc.stdin.write(data)
+                    await proc.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    stopped = True  # ffmpeg gave up; its exit code reports why
+            elif msg.get("text") is not None:
+                text = msg["text"].strip()
+                try:
+                    stopped = text == "stop" or json.loads(text).get("type") == "stop"
+                except (ValueError, AttributeError):
+                    stopped = False
+
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        if await proc.wait() != 0:
+            part_path.unlink(missing_ok=True)
+            await ws.send_json({"status": "error", "detail": "ffmpeg conversion failed"})
+            await ws.close(code=1011)
+            return
+        os.replace(part_path, out_path)
+
+        conversion_path_counts["ffmpeg-live"] += 1
+        try:
+            duration = round(get_wav_duration_seconds(out_path), 3)
+        except Exception:
+            duration = None
+        sha256 = digest.hexdigest()
+        if UPLOAD_DEDUP:
+            # a fallback /api/upload-audio of the same recording dedups to this WAV
+            dedup_index.put(sha256, out_filename, duration)
+        await ws.send_json({
+            "status": "ok",
+            "wav_filename": out_filename,
+            "wav_path": str(out_path),
+            "duration_seconds": duration,
+            "bytes_received": received,
+            "peak_bytes_buffered": peak,
+            "conversion": "ffmpeg-live",
+            "message": "File converted to WAV (mono, 16k). Proceed with transcription/analysis."
+        })
+        await ws.close()
+    except Exception:
+        logger.exception("live ingest failed")
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if part_path is not None:
+            part_path.unlink(missing_ok=True)
+        raise
+    finally:
+        _live_sessions -= 1
+
+
+def file_sha256(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """SHA-256 of a file on disk, read in bounded chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class GenAIFileCache:
+    """
+    WAV SHA-256 -> GenAI uploaded-file handle (name, uri, mime type, expiry),
+    persisted as JSON in UPLOAD_DIR so re-analysis after a restart still skips
+    the upload. Concurrent misses for the same hash share one upload. Worker
+    processes share the file: misses re-read it, and every write re-reads it
+    and applies just its own change under a ProcessFileLock, so concurrent
+    writers never drop each other's entries.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = ProcessFileLock(path.with_name(path.name + ".lock"))
+        self._entries = None
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def _read(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.exception("ignoring unreadable GenAI file cache %s", self.path)
+            return {}
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _save(self, sha256: str, entry) -> None:
+        """
+        Set (or with entry=None remove) one handle, merged into the current file
+        contents. Blocks on the cross-process lock; call it from a worker thread.
+        """
+        try:
+            with self._lock.hold():
+                now = time.time()
+                entries = self._read()
+                if entry is None:
+                    entries.pop(sha256, None)
+                else:
+                    entries[sha256] = entry
+                entries = {k: v for k, v in entries.items() if v["expires_at"] > now}
+                self._entries = entries
+                tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(entries), encoding="utf-8")
+                os.replace(tmp, self.path)
+        except Exception:
+            logger.exception("failed to persist GenAI file cache")
+
+    def _live(self, entry) -> bool:
+        return entry is not None and entry["expires_at"] - GENAI_FILE_EXPIRY_MARGIN > time.time()
+
+    def get(self, sha256: str):
+        entry = self._load().get(sha256)
+        if not self._live(entry):
+            # another worker may have uploaded it since we last read the file
+            self._entries = self._read()
+            entry = self._entries.get(sha256)
+        return entry if self._live(entry) else None
+
+    async def drop(self, sha256: str) -> None:
+        await asyncio.to_thread(self._save, sha256, None)
+
+    async def _upload(self, sha256: str, upload) -> dict:
+        uploaded = await upload()
+        expires = getattr(uploaded, "expiration_time", None)
+        if isinstance(expires, datetime):
+            if expires.tzinfo is None:
+                expires = expires.replace(tzinfo=timezone.utc)
+            expires_at = expires.timestamp()
+        else:
+            expires_at = time.time() + GENAI_FILE_DEFAULT_TTL
+        entry = {
+            "name": uploaded.name,
+            "uri": uploaded.uri,
+            "mime_type": uploaded.mime_type or "audio/wav",
+            "expires_at": expires_at,
+        }
+        await asyncio.to_thread(self._save, sha256, entry)
+        return entry
+
+    async def get_or_upload(self, sha256: str, upload):
+        """
+        Return (entry, cached) for sha256, calling `upload()` (an async function
+        returning a genai File) only if no live handle exists or is in flight.
+        `cached` is True only for a handle that was already stored; callers that
+        join an in-flight upload get a fresh handle and cached=False.
+        """
+        entry = self.get(sha256)
+        if entry is not None:
+            self.hits += 1
+            return entry, True
+        task = self._inflight.get(sha256)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._upload(sha256, upload))
+            self._inflight[sha256] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(sha256, None))
+        else:
+            self.shared += 1
+        # shield: one caller going away must not cancel an upload others wait on
+        return await asyncio.shield(task), False
+
+    def snapshot(self) -> dict:
+        return {
+            "entries": len(self._load()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_inflight": self.shared,
+        }
+
+
+genai_file_cache = GenAIFileCache(UPLOAD_DIR / ".genai_files.json")
+
+
+class GenAIThrottled(Exception):
+    """Raised when a GenAI call could not get a limiter slot within the wait timeout."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"GenAI {reason} limit reached, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills `per_minute` tokens per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def wait_time(self, n: float) -> float:
+        """Seconds until n tokens are available (0 if they are now)."""
+        self._refill()
+        n = min(n, self.per_minute)  # a single oversized call still gets through
+        return 0.0 if self.tokens >= n else (n - self.tokens) * 60.0 / self.per_minute
+
+    def take(self, n: float) -> None:
+        self.tokens -= min(n, self.per_minute)
+
+
+class GenAILimiter:
+    """
+    Shared limiter for outbound GenAI calls: a concurrency cap plus optional
+    requests/minute and tokens/minute buckets. Callers queue instead of firing
+    blindly into a 429 from the API; anyone still waiting after `wait_timeout`
+    gets GenAIThrottled.
+    """
+
+    def __init__(self, max_inflight: int, rpm: int, tpm: int, wait_timeout: float):
+        self.max_inflight = max(1, max_inflight)
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self.wait_timeout = wait_timeout
+        self._sem = None  # created lazily inside the running event loop
+        self._bucket_lock = None
+        self.inflight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.throttled = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def _take_tokens(self, tokens: float, deadline: float) -> None:
+        # one waiter at a time, so buckets are drained in arrival order
+        async with self._bucket_lock:
+            while True:
+                wait = max(
+                    self.rpm.wait_time(1) if self.rpm else 0.0,
+                    self.tpm.wait_time(tokens) if self.tpm else 0.0,
+                )
+                if wait == 0.0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    raise GenAIThrottled("requests/tokens per minute", math.ceil(wait))
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self.rpm.take(1)
+            if self.tpm:
+                self.tpm.take(tokens)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, tokens: float = 0):
+        """Hold one in-flight slot (after passing the rate buckets) for the block."""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_inflight)
+            self._bucket_lock = asyncio.Lock()
+        queued_at = time.monotonic()
+        deadline = queued_at + self.wait_timeout
+        self.waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(self._sem.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise GenAIThrottled("concurrency", max(1, math.ceil(self.wait_timeout / 2)))
+            try:
+                await self._take_tokens(tokens, deadline)
+            except BaseException:
+                self._sem.release()
+                raise
+        except GenAIThrottled as e:
+            self.throttled += 1
+            logger.warning("%s", e)
+            raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - queued_at
+        self.total_wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.calls += 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._sem.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "max_inflight": self.max_inflight,
+            "rpm": self.rpm.per_minute if self.rpm else None,
+            "tpm": self.tpm.per_minute if self.tpm else None,
+            "inflight": self.inflight,
+            "queue_depth": self.waiting,
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.calls, 4) if self.calls else 0.0,
+            "max_wait_seconds": round(self.max_wait_seconds, 4),
+        }
+
+
+genai_limiter = GenAILimiter(GENAI_MAX_INFLIGHT, GENAI_RPM, GENAI_TPM, GENAI_WAIT_TIMEOUT)
+
+
+def _genai_throttled(e: GenAIThrottled) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="GenAI rate limit reached, retry later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def estimate_generation_tokens(prompt: str, wav_size: int) -> float:
+    """Rough token count of a generation call on a 16 kHz mono 16-bit WAV of wav_size bytes."""
+    audio_seconds = max(0, wav_size - 44) / (TARGET_WAV_FORMAT[1] * TARGET_WAV_FORMAT[2])
+    return len(prompt) / 4 + audio_seconds * GENAI_AUDIO_TOKENS_PER_SECOND + GENAI_OUTPUT_TOKEN_ESTIMATE
+
+
+def is_retryable_genai_error(e: BaseException) -> bool:
+    """Transient failures worth retrying: 408/429/5xx from the API and network errors."""
+    if isinstance(e, genai_errors.APIError):
+        return e.code in GENAI_RETRYABLE_STATUS
+    return isinstance(e, (asyncio.TimeoutError, ConnectionError) + _TRANSPORT_ERRORS)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(GENAI_RETRY_MAX_DELAY, GENAI_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+# retries per operation, retry give-ups, hedges fired and hedges that won
+genai_retry_stats = Counter()
+
+
+class GenAICircuitOpen(Exception):
+    """Raised instead of calling GenAI while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker. closed: calls flow and outcomes are recorded in
+    a sliding window. open: calls are refused until `cooldown` passes.
+    half_open: up to `half_open_calls` trial calls; if they all succeed the
+    breaker closes, any failure re-opens it. Transitions are logged.
+    """
+
+    def __init__(self, name: str, window: int, min_calls: int, error_rate: float, cooldown: float, half_open_calls: int):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.half_open_calls = max(1, half_open_calls)
+        self.state = "closed"
+        self._outcomes = deque(maxlen=max(window, self.min_calls))
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self.rejected = 0
+        self.transitions = deque(maxlen=20)
+
+    def _transition(self, new_state: str) -> None:
+        logger.warning("circuit breaker %s: %s -> %s", self.name, self.state, new_state)
+        self.transitions.append({"at": time.time(), "from": self.state, "to": new_state})
+        self.state = new_state
+        if new_state == "open":
+            self._opened_at = time.monotonic()
+        elif new_state == "half_open":
+            self._trials = 0
+            self._trial_successes = 0
+        elif new_state == "closed":
+            self._outcomes.clear()
+
+    def acquire(self) -> bool:
+        """Admit one call or raise GenAICircuitOpen. Returns True for a half-open trial call."""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                self.rejected += 1
+                raise GenAICircuitOpen(f"{self.name} circuit open")
+            self._transition("half_open")
+        if self.state == "half_open":
+            if self._trials >= self.half_open_calls:
+                self.rejected += 1
+                raise GenAICircuitOpen(f"{self.name} circuit half-open, trial in progress")
+            self._trials += 1
+            return True
+        return False
+
+    def record(self, trial: bool, ok) -> None:
+        """Outcome of an admitted call: True, False, or None for no verdict (e.g. throttled locally)."""
+        if trial:
+            if self.state != "half_open":
+                return
+            self._trials -= 1
+            if ok is False:
+                self._transition("open")
+            elif ok:
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_calls:
+                    self._transition("closed")
+            return
+        if self.state != "closed" or ok is None:
+            return  # late result from before the breaker opened
+        self._outcomes.append(bool(ok))
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._transition("open")
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": self._outcomes.count(False),
+            "rejected": self.rejected,
+            "transitions": list(self.transitions),
+        }
+
+
+genai_breaker = CircuitBreaker(
+    "genai",
+    window=GENAI_BREAKER_WINDOW,
+    min_calls=GENAI_BREAKER_MIN_CALLS,
+    error_rate=GENAI_BREAKER_ERROR_RATE,
+    cooldown=GENAI_BREAKER_COOLDOWN,
+    half_open_calls=GENAI_BREAKER_HALF_OPEN_CALLS,
+)
+
+
+async def call_genai_with_retry(op: str, call):
+    """
+    Await `call()` (one limited GenAI request), retrying retryable errors with
+    jittered exponential backoff. The limiter slot is taken inside `call`, so
+    nothing is held while backing off. The whole retried call counts as one
+    outcome for the circuit breaker; GenAICircuitOpen is raised without
+    calling GenAI while it is open.
+    """
+    trial = genai_breaker.acquire()
+    try:
+        result = await _call_with_backoff(op, call)
+    except GenAIThrottled:
+        genai_breaker.record(trial, None)
+        raise
+    except BaseException as e:
+        # only transient/server-side failures say anything about GenAI health
+        genai_breaker.record(trial, False if is_retryable_genai_error(e) else None)
+        raise
+    genai_breaker.record(trial, True)
+    return result
+
+
+async def _call_with_backoff(op: str, call):
+    attempt = 1
+    while True:
+        try:
+            return await call()
+        except GenAIThrottled:
+            raise  # our own limiter said no; retrying would only queue again
+        except Exception as e:
+            if not is_retryable_genai_error(e):
+                raise
+            if attempt >= GENAI_RETRY_ATTEMPTS:
+                genai_retry_stats[f"{op}_gave_up"] += 1
+                raise
+            delay = backoff_delay(attempt)
+            genai_retry_stats[f"{op}_retries"] += 1
+            logger.warning("GenAI %s failed (%s); retry %d in %.2fs", op, e, attempt, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies for percentile estimates."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1):
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+generate_latency = LatencyTracker()
+
+
+async def generate_with_hedge(call):
+    """
+    Await `call(on_slot)` (one limited generate_content request, which calls
+    on_slot() once it holds its genai_limiter slot). With GENAI_HEDGE on and
+    enough latency history, a second identical request is fired once the first
+    has held its slot longer than the configured percentile; the first success
+    wins and the other is cancelled. No hedge is fired while other callers are
+    queued on the limiter, since it would only add to the backlog.
+    One latency sample is recorded per call, measured from the primary getting
+    its slot (queueing is not generation latency): when the hedge wins that is
+    a lower bound on the cancelled primary's latency, so hedging doesn't drag
+    the percentile it is driven by downwards.
+    """
+    started = None
+    slot_held = asyncio.Event()
+
+    def on_slot():
+        nonlocal started
+        started = time.monotonic()
+        slot_held.set()
+
+    def succeeded(result):
+        generate_latency.record(time.monotonic() - started)
+        return result
+
+    delay = generate_latency.percentile(GENAI_HEDGE_PERCENTILE, GENAI_HEDGE_MIN_SAMPLES) if GENAI_HEDGE else None
+    if delay is None:
+        return succeeded(await call(on_slot))
+
+    primary = asyncio.ensure_future(call(on_slot))
+    pending = {primary}
+    try:
+        slot = asyncio.ensure_future(slot_held.wait())
+        try:
+            await asyncio.wait({primary, slot}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            slot.cancel()
+        if not primary.done():
+            await asyncio.wait({primary}, timeout=delay)
+        if primary.done():
+            return succeeded(primary.result())
+        if genai_limiter.waiting > 0:
+            genai_retry_stats["hedges_skipped"] += 1
+            return succeeded(await primary)
+
+        genai_retry_stats["hedges_fired"] += 1
+        hedge = asyncio.ensure_future(call(lambda: None))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    if task is hedge:
+                        genai_retry_stats["hedge_wins"] += 1
+                    return succeeded(task.result())
+        # both failed: surface the primary's error
+        return primary.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of successful analysis responses: an in-process LRU in front
+    of one JSON file per key on disk. Entries expire after `ttl` seconds; each
+    tier is bounded by entry count, evicting least recently used (memory) or
+    oldest written (disk).
+    """
+
+    def __init__(self, directory: Path, ttl: int, memory_entries: int, disk_entries: int):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()  # key -> (stored_at, result)
+        self._disk_count = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(wav_sha256: str, keywords: list, prompt: str, model: str) -> str:
+        prompt_sha256 = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps([wav_sha256, keywords, prompt_sha256, model])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, stored_at: float, result: dict) -> None:
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str):
+        """Return (result, "memory" | "disk") or (None, None)."""
+        now = time.time()
+        hit = self._memory.get(key)
+        if hit is not None:
+            stored_at, result = hit
+            if now - stored_at <= self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return result, "memory"
+            del self._memory[key]
+        path = self.directory / f"{key}.json"
+        try:
+            rec = json.loads(path.read_text(encoding="utf-8"))
+            if now - rec["stored_at"] <= self.ttl:
+                self._remember(key, rec["stored_at"], rec["result"])
+                self.disk_hits += 1
+                return rec["result"], "disk"
+            path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("dropping unreadable analysis cache entry %s", path)
+            path.unlink(missing_ok=True)
+        self.misses += 1
+        return None, None
+
+    def put(self, key: str, result: dict) -> None:
+        stored_at = time.time()
+        self._remember(key, stored_at, result)
+        path = self.directory / f"{key}.json"
+        tmp = path.with_suffix(".tmp")
+        existed = path.exists()
+        try:
+            tmp.write_text(json.dumps({"stored_at": stored_at, "result": result}), encoding="utf-8")
+            os.replace(tmp, path)
+        except Exception:
+            logger.exception("failed to persist analysis cache entry")
+            return
+        if self._disk_count is None:
+            self._disk_count = sum(1 for _ in self.directory.glob("*.json"))
+        elif not existed:
+            self._disk_count += 1
+        # prune in batches so a full cache does not rescan the directory on every put
+        if self._disk_count > self.disk_entries * 1.1:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        excess = len(files) - self.disk_entries
+        for path in files[:max(0, excess)]:
+            path.unlink(missing_ok=True)
+            self.evictions += 1
+        self._disk_count = min(len(files), self.disk_entries)
+
+    def snapshot(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_count,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+        }
+
+
+analysis_cache = AnalysisCache(
+    UPLOAD_DIR / ".analysis_cache",
+    ttl=ANALYSIS_CACHE_TTL,
+    memory_entries=ANALYSIS_CACHE_MEMORY_ENTRIES,
+    disk_entries=ANALYSIS_CACHE_DISK_ENTRIES,
+)
+
+
+@app.post("/api/analyze_with_genai")
+async def analyze_with_genai(payload: Request):
+    """
+    Expects JSON body: {"wav_filename": "<name.wav>", "keywords": ["k1","k2"]} (keywords optional;
+    "no_cache": true skips the analysis result cache)
+    Uploads WAV to Google GenAI, asks for a strict JSON response containing transcript + scores,
+    validates/parses the model output, and returns the parsed JSON to the client.
+    """
+    body = await payload.json()
+    wav_path = resolve_wav_path(body.get("wav_filename"))
+    keywords = body.get("keywords") or []
+    return await analyze_audio(wav_path, keywords, use_cache=not body.get("no_cache"))
+
+
+def resolve_wav_path(wav_filename) -> Path:
+    """Path of a converted WAV in UPLOAD_DIR; the most recent one if no name is given."""
+    # If wav_filename not supplied, pick the most recently modified .wav in UPLOAD_DIR
+    if not wav_filename:
+        wavs = sorted(UPLOAD_DIR.glob("*.wav"), key=lambda p: p.stat().st_mtime, reverse=True)
+        if not wavs:
+            raise HTTPException(status_code=404, detail="no wav files available")
+        return wavs[0]
+    wav_path = UPLOAD_DIR / wav_filename
+    if not wav_path.exists():
+        raise HTTPException(status_code=404, detail="wav file not found")
+    return wav_path
+
+
+# Instructions sent with every clip; keywords are appended by build_prompt
+BASE_PROMPT = (
+    "You are an assistant that transcribes an audio clip and rates the speaker with objective numeric scores.\n"
+    "Output MUST be valid JSON and nothing else. Follow this JSON schema exactly:\n"
+    "{\n"
+    "  \"transcript\": \"<string>\",\n"
+    "  \"scores\": {\n"
+    "    \"overall\": \"<0-100>\",\n"
+    "    \"fluency\": \"<0-100>\",\n"
+    "    \"confidence\": \"<0-100> (INTEGER, required)\",\n"
+    "    \"filler\": \"<0-100>\",\n"
+    "    \"filler_rate_per_min\": \"<float> (required, decimals allowed)\",\n"
+    "    \"tone\": \"<neutral|positive|negative|anxious|angry|happy>\",\n"
+    "    \"keyword_coverage_pct\": \"<0-100|null>\"\n"
+    "  },\n"
+    "  \"counts\": {\n"
+    "    \"total_words\": \"<int>\",\n"
+    "    \"total_fillers\": \"<int>\",\n"
+    "    \"long_pauses\": \"<int>\"\n"
+    "  },\n"
+    "  \"suggestions\": [\"<short suggestion strings>\"]\n"
+    "}\n"
+    "REQUIREMENTS:\n"
+    "- \"confidence\" MUST be an integer between 0 and 100. Do not return null.\n"
+    "- \"filler_rate_per_min\" MUST be a numeric value (decimals allowed) representing estimated filler words per minute. Do not return null.\n"
+    "- Count filler words as occurrences of: \"um\", \"uh\", \"like\" (when used as a filler), \"you know\", \"I mean\". Do NOT count words used with clear semantic meaning.\n"
+    "- \"total_fillers\" should be the integer count of detected filler occurrences in the transcript.\n"
+    "- If you cannot determine a metric, estimate conservatively rather than returning null for confidence/filler_rate_per_min.\n"
+    "Provide integers for 0-100 scores; use one decimal place for filler_rate_per_min when appropriate.\n"
+)
+
+
+def _int_0_100(description: str) -> dict:
+    return {"type": "INTEGER", "minimum": 0, "maximum": 100, "description": description}
+
+
+# Response schema mirroring the JSON layout described in BASE_PROMPT.
+# propertyOrdering puts the transcript first.
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "transcript": {"type": "STRING"},
+        "scores": {
+            "type": "OBJECT",
+            "properties": {
+                "overall": _int_0_100("overall score"),
+                "fluency": _int_0_100("fluency score"),
+                "confidence": _int_0_100("confidence score"),
+                "filler": _int_0_100("filler score"),
+                "filler_rate_per_min": {"type": "NUMBER", "description": "estimated filler words per minute"},
+                "tone": {"type": "STRING", "enum": ["neutral", "positive", "negative", "anxious", "angry", "happy"]},
+                "keyword_coverage_pct": {**_int_0_100("keyword coverage percent"), "nullable": True},
+            },
+            "required": ["overall", "fluency", "confidence", "filler", "filler_rate_per_min", "tone"],
+            "propertyOrdering": [
+                "overall", "fluency", "confidence", "filler", "filler_rate_per_min", "tone", "keyword_coverage_pct",
+            ],
+        },
+        "counts": {
+            "type": "OBJECT",
+            "properties": {
+                "total_words": {"type": "INTEGER"},
+                "total_fillers": {"type": "INTEGER"},
+                "long_pauses": {"type": "INTEGER"},
+            },
+            "required": ["total_words", "total_fillers", "long_pauses"],
+            "propertyOrdering": ["total_words", "total_fillers", "long_pauses"],
+        },
+        "suggestions": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["transcript", "scores", "counts", "suggestions"],
+    "propertyOrdering": ["transcript", "scores", "counts", "suggestions"],
+}
+
+# per output mode ("structured" / "freeform"): generations, parse failures, retries
+genai_parse_stats = {"structured": Counter(), "freeform": Counter()}
+
+
+def generation_config():
+    """GenerateContentConfig for analysis calls (None for free-form output)."""
+    if not GENAI_STRUCTURED_OUTPUT:
+        return None
+    return genai_types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=ANALYSIS_RESPONSE_SCHEMA,
+    )
+
+
+def _prompt_fingerprint() -> str:
+    """Everything besides keywords that shapes the model output, for cache keys."""
+    if GENAI_STRUCTURED_OUTPUT:
+        return BASE_PROMPT + json.dumps(ANALYSIS_RESPONSE_SCHEMA, sort_keys=True)
+    return BASE_PROMPT
+
+
+def normalize_keywords(keywords) -> list:
+    """Trim, lowercase, dedupe and sort keywords so equivalent requests share prompt and cache key."""
+    return sorted({" ".join(str(k).split()).lower() for k in keywords or [] if str(k).strip()})
+
+
+def build_prompt(keywords: list) -> str:
+    prompt = BASE_PROMPT
+    if keywords:
+        prompt += "Keywords to check for coverage: " + ", ".join(keywords) + "\n"
+    return prompt
+
+
+def parse_model_json(s: str):
+    """Parse the JSON object out of model output (tolerates code fences / stray text)."""
+    if not s:
+        return None
+    s = s.strip()
+    # strip triple-backticks if present
+    if s.startswith("```") and s.endswith("```"):
+        s = "\n".join(s.splitlines()[1:-1])
+    try:
+        return json.loads(s)
+    except Exception:
+        start = s.find('{')
+        end = s.rfind('}')
+        if start != -1 and end != -1 and end > start:
+            try:
+                return json.loads(s[start:end+1])
+            except Exception:
+                return None
+        return None
+
+
+def normalize_scores(scores) -> dict:
+    """Cast numeric score fields to int where possible."""
+    try:
+        for key in ["fluency", "confidence", "keyword_coverage_pct"]:
+            val = scores.get(key)
+            if val is not None:
+                scores[key] = int(float(val))
+    except Exception:
+        pass
+    return scores
+
+
+def normalize_result(parsed: dict) -> dict:
+    # basic normalization: cast numeric score fields if possible
+    if isinstance(parsed, dict) and isinstance(parsed.get("scores", {}), dict):
+        parsed["scores"] = normalize_scores(parsed.get("scores", {}))
+    return parsed
+
+
+def local_audio_stats(wav_bytes: bytes) -> dict:
+    """
+    Cheap local analysis of a 16 kHz mono 16-bit WAV: duration plus silence and
+    pause counts from 20 ms frame energy. Used when GenAI is unavailable.
+    """
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        rate = wf.getframerate() or 1
+        sampwidth = wf.getsampwidth()
+        channels = wf.getnchannels()
+        frames = wf.readframes(wf.getnframes())
+    frame_len = max(1, rate // 50)  # 20 ms
+    threshold = 32768.0 * 10 ** (LOCAL_SILENCE_DBFS / 20.0)
+    if np is not None and sampwidth == 2:
+        x = np.frombuffer(frames, dtype="<i2").astype(np.float32)
+        if channels > 1:
+            x = x[: len(x) - len(x) % channels].reshape(-1, channels).mean(axis=1)
+        n = len(x) // frame_len
+        rms = np.sqrt(np.mean(x[: n * frame_len].reshape(n, frame_len) ** 2, axis=1)) if n else np.zeros(0)
+        voiced = (rms >= threshold).tolist()
+    else:
+        import array
+        samples = array.array("h", frames) if sampwidth == 2 else array.array("h")
+        step = frame_len * max(1, channels)
+        voiced = []
+        for i in range(0, len(samples) - step + 1, step):
+            block = samples[i:i + step]
+            voiced.append(math.sqrt(sum(v * v for v in block) / len(block)) >= threshold)
+
+    frame_seconds = frame_len / float(rate)
+    # gaps between the first and last voiced frame; leading/trailing silence is not a pause
+    pauses = []
+    run = 0
+    seen_voice = False
+    for v in voiced:
+        if v:
+            if seen_voice and run:
+                pauses.append(run * frame_seconds)
+            seen_voice = True
+            run = 0
+        else:
+            run += 1
+    speech_seconds = sum(voiced) * frame_seconds
+    duration = len(frames) / float(sampwidth * max(1, channels) * rate)
+    return {
+        "duration_seconds": round(duration, 3),
+        "speech_seconds": round(speech_seconds, 3),
+        "silence_seconds": round(max(0.0, duration - speech_seconds), 3),
+        "pauses": sum(1 for p in pauses if p >= LOCAL_PAUSE_SECONDS),
+        "long_pauses": sum(1 for p in pauses if p >= LOCAL_LONG_PAUSE_SECONDS),
+        "longest_pause_seconds": round(max(pauses), 3) if pauses else 0.0,
+    }
+
+
+async def local_analysis_response(audio) -> dict:
+    """Degraded analysis body returned while the GenAI circuit breaker is open."""
+    wav_bytes = bytes(audio) if isinstance(audio, (bytes, bytearray)) else await asyncio.to_thread(audio.read_bytes)
+    try:
+        stats = await asyncio.to_thread(local_audio_stats, wav_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"GenAI unavailable and local analysis failed: {e}")
+    return {
+        "status": "degraded",
+        "degraded": True,
+        "message": "GenAI is unavailable; returning local audio statistics only (no transcript or scores).",
+        "result": {
+            "transcript": None,
+            "scores": {},
+            "counts": {"total_words": None, "total_fillers": None, "long_pauses": stats["long_pauses"]},
+            "suggestions": [],
+            "local": stats,
+        },
+        "breaker": genai_breaker.state,
+    }
+
+
+async def wav_content_sha256(audio) -> str:
+    if isinstance(audio, (bytes, bytearray)):
+        return hashlib.sha256(audio).hexdigest()
+    return await asyncio.to_thread(file_sha256, audio)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one execution. The first
+    caller starts `fn()` as a task; callers arriving before it finishes await
+    the same task and get the same result (or exception).
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.max_callers = 0
+
+    async def run(self, key: str, fn):
+        """Return (result, callers), callers being how many requests shared this execution."""
+        flight = self._inflight.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = {"task": asyncio.ensure_future(fn()), "callers": 1}
+            self._inflight[key] = flight
+            flight["task"].add_done_callback(lambda _t: self._finish(key, flight))
+        else:
+            self.coalesced += 1
+            flight["callers"] += 1
+        # shield: one caller going away must not cancel the execution others wait on
+        result = await asyncio.shield(flight["task"])
+        return result, flight["callers"]
+
+    def _finish(self, key: str, flight: dict) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        self.max_callers = max(self.max_callers, flight["callers"])
+        if flight["callers"] > 1:
+            logger.info("analysis %s served %d coalesced callers", key[:12], flight["callers"])
+
+    def snapshot(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced_callers": self.coalesced,
+            "max_callers_per_execution": self.max_callers,
+        }
+
+
+analysis_singleflight = SingleFlight()
+
+
+async def analyze_audio(audio, keywords: list, use_cache: bool = True) -> dict:
+    """
+    Run the GenAI transcription/scoring pipeline on one WAV, consulting the
+    analysis result cache first (use_cache=False bypasses it). Concurrent
+    identical requests are coalesced onto one GenAI call.
+    `audio` is a Path in UPLOAD_DIR or the WAV bytes already in memory.
+    Returns the /api/analyze_with_genai response body; raises HTTPException on failure.
+    """
+    keywords = normalize_keywords(keywords)
+    wav_sha256 = await wav_content_sha256(audio)
+    cache_key = AnalysisCache.make_key(wav_sha256, keywords, _prompt_fingerprint(), GENAI_MODEL)
+
+    if use_cache:
+        cached, tier = analysis_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cache": tier}
+    else:
+        analysis_cache.bypassed += 1
+
+    async def run():
+        try:
+            result = await run_genai_analysis(audio, wav_sha256, build_prompt(keywords))
+        except GenAICircuitOpen:
+            return await local_analysis_response(audio)
+        if result.get("status") == "ok":
+            analysis_cache.put(cache_key, result)
+        return result
+
+    # identical requests arriving while this one runs share its result
+    result, callers = await analysis_singleflight.run(cache_key, run)
+    return {**result, "cache": "miss" if use_cache else "bypass", "coalesced_callers": callers}
+
+
+def wav_size(audio) -> int:
+    return len(audio) if isinstance(audio, (bytes, bytearray)) else audio.stat().st_size
+
+
+async def attach_audio(audio, wav_sha256: str):
+    """
+    Build the audio Part for a generation request: inline bytes for short clips,
+    otherwise a (possibly cached) files-API handle.
+    Returns (part, audio_mode); raises HTTPException if the upload fails.
+    """
+    size = wav_size(audio)
+    if size <= GENAI_INLINE_MAX_BYTES:
+        # Short clip: send the bytes inline, skipping the files API round trip
+        if not isinstance(audio, (bytes, bytearray)):
+            audio = await asyncio.to_thread(audio.read_bytes)
+        uploaded = genai_types.Part.from_bytes(data=bytes(audio), mime_type="audio/wav")
+        audio_mode = "inline"
+    else:
+        # Upload file to GenAI, unless this exact WAV already has a live handle
+        async def upload_once():
+            file = io.BytesIO(audio) if isinstance(audio, (bytes, bytearray)) else str(audio)
+            async with genai_limiter.acquire():
+                return await client.aio.files.upload(file=file, config={"mime_type": "audio/wav"})
+
+        async def upload():
+            return await call_genai_with_retry("upload", upload_once)
+        try:
+            handle, cached = await genai_file_cache.get_or_upload(wav_sha256, upload)
+        except GenAIThrottled as e:
+            raise _genai_throttled(e)
+        except GenAICircuitOpen:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"GenAI file upload failed: {e}")
+        uploaded = genai_types.Part.from_uri(file_uri=handle["uri"], mime_type=handle["mime_type"])
+        audio_mode = "files_api_cached" if cached else "files_api"
+    return uploaded, audio_mode
+
+
+async def run_genai_analysis(audio, wav_sha256: str, base_prompt: str) -> dict:
+    """
+    Uncached GenAI call: attach the audio (inline or via the files API), generate,
+    parse. Uses the async client (client.aio) throughout so the event loop keeps
+    serving other requests while GenAI calls are in flight.
+    """
+    uploaded, audio_mode = await attach_audio(audio, wav_sha256)
+
+    config = generation_config()
+    stats = genai_parse_stats["structured" if config is not None else "freeform"]
+    stats["generations"] += 1
+
+    tokens = estimate_generation_tokens(base_prompt, wav_size(audio))
+
+    async def generate(contents):
+        async def once(on_slot):
+            async with genai_limiter.acquire(tokens):
+                on_slot()
+                return await client.aio.models.generate_content(model=GENAI_MODEL, contents=contents, config=config)
+        return await call_genai_with_retry("generate", lambda: generate_with_hedge(once))
+
+    # Call the model
+    try:
+        resp = await generate([base_prompt, uploaded])
+        raw_text = getattr(resp, "text", None) or (resp.get("text") if isinstance(resp, dict) else str(resp))
+    except GenAIThrottled as e:
+        raise _genai_throttled(e)
+    except GenAICircuitOpen:
+        raise
+    except Exception as e:
+        if audio_mode == "files_api_cached":
+            # the remote file may have been deleted early; re-upload next time
+            await genai_file_cache.drop(wav_sha256)
+        raise HTTPException(status_code=500, detail=f"GenAI generation failed: {e}")
+
+    parsed = parse_model_json(raw_text)
+
+    # retry once with a stricter instruction if parsing failed
+    if parsed is None:
+        stats["parse_failures"] += 1
+        stats["retries"] += 1
+        retry_prompt = "ONLY OUTPUT A SINGLE JSON OBJECT following the schema. Do not add ANY explanatory text."
+        try:
+            resp2 = await generate([retry_prompt, base_prompt, uploaded])
+            raw_text2 = getattr(resp2, "text", None) or (resp2.get("text") if isinstance(resp2, dict) else str(resp2))
+            parsed = parse_model_json(raw_text2)
+            if parsed is not None:
+                raw_text = raw_text2
+        except GenAIThrottled as e:
+            raise _genai_throttled(e)
+        except GenAICircuitOpen:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"GenAI retry failed: {e}")
+
+    if parsed is None:
+        stats["retry_parse_failures"] += 1
+        # return raw model output for debugging
+        return {"status": "error", "message": "Model did not return valid JSON", "raw": raw_text, "audio_mode": audio_mode}
+
+    normalize_result(parsed)
+    return {"status": "ok", "result": parsed, "raw_text": raw_text, "audio_mode": audio_mode}
+
+
+class IncrementalJsonFields:
+    """
+    Incremental parser for a single JSON object arriving in text chunks.
+    feed() returns (key, value) for every top-level member whose value has
+    completed so far, without waiting for the rest of the object. Text before
+    the opening brace (e.g. a code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def _emit(self, out: list, fragment: str) -> None:
+        try:
+            out.append((self._key, json.loads(fragment)))
+        except ValueError:
+            pass  # malformed member; the final full parse reports it
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> list:
+        out = []
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        if self._value_start is not None:
+                            self._emit(out, text[self._value_start:i + 1])  # top-level string value
+                        elif self._key is None:
+                            self._key = json.loads(text[self._key_start:i + 1])
+            elif not self._started:
+                if c == "{":
+                    self._started = True
+                    self._depth = 1
+            elif c == '"':
+                self._in_str = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif c in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(out, text[self._value_start:i + 1])  # object/array value closed
+                elif self._depth == 0 and self._value_start is not None:
+                    self._emit(out, text[self._value_start:i])  # trailing scalar value
+            elif self._depth == 1 and self._key is not None:
+                if c == "," and self._value_start is not None:
+                    self._emit(out, text[self._value_start:i])  # scalar value ended
+                elif c not in ":," and not c.isspace() and self._value_start is None:
+                    self._value_start = i  # number / true / false / null
+        self._pos = len(text)
+        return out
+
+
+# time from request to first streamed field (time-to-first-useful-byte)
+analysis_stream_stats = {"streams": 0, "completed": 0, "errors": 0, "ttfb_total": 0.0, "ttfb_max": 0.0, "ttfb_count": 0}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_analysis_events(wav_path: Path, keywords: list, use_cache: bool):
+    """
+    Yield SSE events for one analysis: one event per top-level field
+    (transcript, scores, counts, suggestions) as soon as the model has produced
+    it, then "done" with the same body /api/analyze_with_genai returns, or
+    "error" with {"detail": ...}.
+    """
+    started = time.monotonic()
+    first_field = True
+    analysis_stream_stats["streams"] += 1
+
+    def field_event(key, value) -> str:
+        nonlocal first_field
+        if first_field:
+            ttfb = time.monotonic() - started
+            analysis_stream_stats["ttfb_total"] += ttfb
+            analysis_stream_stats["ttfb_count"] += 1
+            analysis_stream_stats["ttfb_max"] = max(analysis_stream_stats["ttfb_max"], ttfb)
+            first_field = False
+        if key == "scores" and isinstance(value, dict):
+            value = normalize_scores(value)
+        return _sse(key, value)
+
+    try:
+        keywords = normalize_keywords(keywords)
+        wav_sha256 = await wav_content_sha256(wav_path)
+        cache_key = AnalysisCache.make_key(wav_sha256, keywords, _prompt_fingerprint(), GENAI_MODEL)
+        if use_cache:
+            cached, tier = analysis_cache.get(cache_key)
+            if cached is not None:
+                for key, value in cached["result"].items():
+                    yield field_event(key, value)
+                analysis_stream_stats["completed"] += 1
+                yield _sse("done", {**cached, "cache": tier})
+                return
+        else:
+            analysis_cache.bypassed += 1
+
+        uploaded, audio_mode = await attach_audio(wav_path, wav_sha256)
+        config = generation_config()
+        genai_parse_stats["structured" if config is not None else "freeform"]["generations"] += 1
+        prompt = build_prompt(keywords)
+        tokens = estimate_generation_tokens(prompt, wav_size(wav_path))
+        trial = genai_breaker.acquire()
+        attempt = 1
+        while True:
+            fields = IncrementalJsonFields()
+            emitted = False
+            try:
+                async with genai_limiter.acquire(tokens):
+                    stream = await client.aio.models.generate_content_stream(
+                        model=GENAI_MODEL,
+                        contents=[prompt, uploaded],
+                        config=config,
+                    )
+                    async for chunk in stream:
+                        for key, value in fields.feed(getattr(chunk, "text", None) or ""):
+                            emitted = True
+                            yield field_event(key, value)
+                genai_breaker.record(trial, True)
+                break
+            except GenAIThrottled:
+                genai_breaker.record(trial, None)
+                raise
+            except BaseException as e:
+                # only safe to retry while nothing has been sent to the client
+                if emitted or not is_retryable_genai_error(e) or attempt >= GENAI_RETRY_ATTEMPTS:
+                    genai_breaker.record(trial, False if is_retryable_genai_error(e) else None)
+                    if attempt >= GENAI_RETRY_ATTEMPTS and is_retryable_genai_error(e):
+                        genai_retry_stats["stream_gave_up"] += 1
+                    raise
+                genai_retry_stats["stream_retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+
+        parsed = parse_model_json(fields.text)
+        if parsed is None:
+            # no second round trip here: the fields already streamed can't be retracted
+            genai_parse_stats["structured" if config is not None else "freeform"]["parse_failures"] += 1
+            analysis_stream_stats["errors"] += 1
+            yield _sse("done", {"status": "error", "message": "Model did not return valid JSON", "raw": fields.text, "audio_mode": audio_mode})
+            return
+        result = {"status": "ok", "result": normalize_result(parsed), "raw_text": fields.text, "audio_mode": audio_mode}
+        analysis_cache.put(cache_key, result)
+        analysis_stream_stats["completed"] += 1
+        yield _sse("done", {**result, "cache": "miss" if use_cache else "bypass"})
+    except HTTPException as e:
+        analysis_stream_stats["errors"] += 1
+        yield _sse("error", {"detail": e.detail})
+    except GenAIThrottled as e:
+        analysis_stream_stats["errors"] += 1
+        yield _sse("error", {"detail": "GenAI rate limit reached, retry later", "retry_after": e.retry_after})
+    except GenAICircuitOpen:
+        try:
+            yield _sse("done", await local_analysis_response(wav_path))
+        except HTTPException as e:
+            analysis_stream_stats["errors"] += 1
+            yield _sse("error", {"detail": e.detail})
+    except Exception as e:
+        analysis_stream_stats["errors"] += 1
+        logger.exception("streaming analysis failed")
+        yield _sse("error", {"detail": f"GenAI generation failed: {e}"})
+
+
+@app.post("/api/analyze_with_genai/stream")
+async def analyze_with_genai_stream(payload: Request):
+    """
+    Same JSON body as /api/analyze_with_genai, answered as Server-Sent Events
+    so the transcript can be shown before the scores are generated.
+    """
+    body = await payload.json()
+    wav_path = resolve_wav_path(body.get("wav_filename"))
+    return StreamingResponse(
+        stream_analysis_events(wav_path, body.get("keywords") or [], use_cache=not body.get("no_cache")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/upload-and-analyze")
+async def upload_and_analyze(file: UploadFile = File(...), keywords: str = Form(""), no_cache: bool = Form(False)):
+    """
+    Single round trip for the record -> analyze flow: multipart 'file' plus an
+    optional 'keywords' field (comma separated, or a JSON array). Ingests and
+    converts like /api/upload-audio, then hands the WAV straight to the GenAI
+    stage (as bytes for inline-sized clips, otherwise as its path). Returns the /api/analyze_with_genai body plus an "upload" key
+    with the /api/upload-audio metadata.
+    """
+    if not file or not file.filename:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    kw = keywords.strip()
+    if kw.startswith("["):
+        try:
+            kw_list = [str(k).strip() for k in json.loads(kw)]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="keywords must be comma separated or a JSON array")
+    else:
+        kw_list = [k.strip() for k in kw.split(",")]
+    kw_list = [k for k in kw_list if k]
+
+    upload = await ingest_upload(file, file.filename)
+    wav_path = UPLOAD_DIR / upload["wav_filename"]
+    audio = wav_path
+    if wav_path.stat().st_size <= GENAI_INLINE_MAX_BYTES:
+        # short clip: read it once, off the event loop, and send it inline from memory;
+        # longer ones stay on disk and are streamed to the files API from the path
+        audio = await asyncio.to_thread(wav_path.read_bytes)
+    result = await analyze_audio(audio, kw_list, use_cache=not no_cache)
+    return {**result, "upload": upload}
+
+
+class AnalysisJobQueueFull(Exception):
+    """Raised when ANALYSIS_JOB_MAX_QUEUE jobs are already waiting for a worker."""
+
+
+_JOB_TERMINAL = ("done", "failed", "dead")
+
+
+class AnalysisJobs:
+    """
+    Durable analysis queue in SQLite plus a pool of worker tasks running
+    analyze_audio. Any number of processes on the same host may share the
+    database (rollback journal, so no shared-memory WAL index): a job is
+    claimed inside BEGIN IMMEDIATE by setting a lease, the lease is renewed by
+    a heartbeat while the job runs, and a job whose lease has lapsed is
+    claimed again (at-least-once). Transient failures are re-queued with
+    backoff; after `max_attempts` claims the job is marked dead. Client errors
+    (4xx other than 429) fail the job right away.
+    """
+
+    def __init__(self, db_path: Path, workers: int, max_queue: int, ttl: float,
+                 lease_seconds: float, max_attempts: int, poll_interval: float):
+        self.db_path = db_path
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.ttl = ttl
+        self.lease_seconds = max(1.0, lease_seconds)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = None
+        self._tasks = []
+        self.running = 0
+        self.claimed = 0
+        self.redelivered = 0
+        self.requeued = 0
+        self.dead_lettered = 0
+        self.leases_lost = 0
+        self.rejected = 0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout = 30000")
+        return conn
+
+    def _init_db(self) -> None:
+        with contextlib.closing(self._connect()) as conn:
+            # WAL needs a shared-memory index that only works on one host and
+            # never on a network filesystem; the rollback journal only needs locks
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    wav_filename TEXT NOT NULL,
+                    keywords TEXT NOT NULL,
+                    use_cache INTEGER NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    response TEXT,
+                    error TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_available ON jobs (status, available_at)")
+
+    # --- synchronous database operations, run via asyncio.to_thread ---
+
+    def _insert(self, wav_filename: str, keywords: list, use_cache: bool) -> dict:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed', 'dead') AND finished_at < ?",
+                    (now - self.ttl,),
+                )
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.max_queue:
+                    raise AnalysisJobQueueFull(f"{queued} analysis jobs already queued")
+                conn.execute(
+                    "INSERT INTO jobs (id, status, wav_filename, keywords, use_cache, available_at, created_at)"
+                    " VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                    (job_id, wav_filename, json.dumps(keywords), int(use_cache), now, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return self._public(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def _claim(self):
+        """Lease the oldest runnable job (queued, or running with a lapsed lease) to this worker."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = conn.execute(
+                        "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?)"
+                        " OR (status = 'running' AND lease_expires < ?) ORDER BY created_at LIMIT 1",
+                        (now, now),
+                    ).fetchone()
+                    if row is None or row["attempts"] < self.max_attempts:
+                        break
+                    # its last worker died holding it, and it has no attempts left
+                    conn.execute(
+                        "UPDATE jobs SET status = 'dead', lease_owner = NULL, finished_at = ?, error = ? WHERE id = ?",
+                        (now, json.dumps({"status_code": 500, "detail": "worker lease expired on final attempt"}), row["id"]),
+                    )
+                    self.dead_lettered += 1
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?,"
+                        " lease_expires = ?, started_at = ? WHERE id = ?",
+                        (self.worker_id, now + self.lease_seconds, now, row["id"]),
+                    )
+                    if row["status"] == "running":
+                        self.redelivered += 1
+                        logger.warning("redelivering analysis job %s after lease expiry", row["id"])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _renew(self, job_id: str) -> bool:
+        with contextlib.closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (time.time() + self.lease_seconds, job_id, self.worker_id),
+            )
+            return cur.rowcount == 1
+
+    def _finish(self, job_id: str, status: str, response=None, error=None, retry_in: float = 0.0) -> bool:
+        """Record an outcome if this worker still holds the lease; "queued" re-queues after retry_in seconds."""
+        now = time.time()
+        with contextlib.closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, available_at = ?,"
+                " finished_at = ?, response = ?, error = ? WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (
+                    status,
+                    now + retry_in,
+                    now if status in _JOB_TERMINAL else None,
+                    json.dumps(response) if response is not None else None,
+                    json.dumps(error) if error is not None else None,
+                    job_id,
+                    self.worker_id,
+                ),
+            )
+            return cur.rowcount == 1
+
+    def _load(self, job_id: str):
+        with contextlib.closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._public(row) if row is not None else None
+
+    def _counts(self) -> dict:
+        with contextlib.closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    @staticmethod
+    def _public(row) -> dict:
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "wav_filename": row["wav_filename"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "response": json.loads(row["response"]) if row["response"] else None,
+            "error": json.loads(row["error"]) if row["error"] else None,
+        }
+
+    # --- async side ---
+
+    def start(self) -> None:
+        """Start the worker tasks (idempotent); must run inside the event loop."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        # claimed jobs keep their lease and are redelivered once it lapses
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, wav_path: Path, keywords: list, use_cache: bool) -> dict:
+        self.start()
+        try:
+            job = await asyncio.to_thread(self._insert, wav_path.name, keywords, use_cache)
+        except AnalysisJobQueueFull:
+            self.rejected += 1
+            raise
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, wait: float = 0.0):
+        """The job, or None if unknown/expired; polls up to `wait` seconds for it to finish."""
+        deadline = time.monotonic() + wait
+        while True:
+            job = await asyncio.to_thread(self._load, job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in _JOB_TERMINAL or remaining <= 0:
+                return job
+            await asyncio.sleep(min(0.25, remaining))
+
+    async def _heartbeat(self, job_id: str) -> None:
+        interval = self.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await asyncio.to_thread(self._renew, job_id)
+            except sqlite3.Error:
+                # database busy/unavailable: try again sooner, the lease has some slack left
+                logger.exception("renewing lease on analysis job %s failed", job_id)
+                interval = min(interval, 1.0)
+                continue
+            interval = self.lease_seconds / 3
+            if not renewed:
+                self.leases_lost += 1
+                logger.warning("lost lease on analysis job %s; another worker may redeliver it", job_id)
+                return
+
+    async def _finish_retrying(self, job_id: str, status: str, **kwargs) -> bool:
+        """_finish, retried with backoff while the database errors out for up to about a lease period."""
+        deadline = time.monotonic() + self.lease_seconds
+        attempt = 1
+        while True:
+            try:
+                return await asyncio.to_thread(self._finish, job_id, status, **kwargs)
+            except sqlite3.Error:
+                if time.monotonic() >= deadline:
+                    # the lease will lapse and the job be redelivered
+                    logger.exception("recording outcome of analysis job %s failed; giving up", job_id)
+                    return False
+                logger.warning("recording outcome of analysis job %s failed, retrying", job_id, exc_info=True)
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                row = await asyncio.to_thread(self._claim)
+            except sqlite3.Error:
+                logger.exception("claiming analysis job failed")
+                row = None
+            if row is None:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                continue
+            self.claimed += 1
+            self.running += 1
+            heartbeat = asyncio.create_task(self._heartbeat(row["id"]))
+            try:
+                await self._run(row)
+            except Exception:
+                # keep the worker alive; the job is redelivered once its lease lapses
+                logger.exception("analysis worker failed on job %s", row["id"])
+            finally:
+                heartbeat.cancel()
+                self.running -= 1
+
+    async def _run(self, row) -> None:
+        job_id = row["id"]
+        attempts = row["attempts"] + 1
+        try:
+            wav_path = resolve_wav_path(row["wav_filename"])
+            response = await analyze_audio(wav_path, json.loads(row["keywords"]), use_cache=bool(row["use_cache"]))
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                error = {"status_code": e.status_code, "detail": e.detail}
+            else:
+                logger.exception("analysis job %s failed", job_id)
+                error = {"status_code": 500, "detail": f"Analysis failed: {e}"}
+            if 400 <= error["status_code"] < 500 and error["status_code"] != 429:
+                await self._finish_retrying(job_id, "failed", error=error)
+            elif attempts >= self.max_attempts:
+                self.dead_lettered += 1
+                logger.warning("analysis job %s dead-lettered after %d attempts", job_id, attempts)
+                await self._finish_retrying(job_id, "dead", error=error)
+            else:
+                self.requeued += 1
+                await self._finish_retrying(job_id, "queued", error=error, retry_in=backoff_delay(attempts))
+            return
+        if not await self._finish_retrying(job_id, "done", response=response):
+            logger.warning("analysis job %s result not recorded (lease taken over or database unavailable)", job_id)
+
+    def snapshot(self) -> dict:
+        counts = self._counts()
+        return {
+            "workers": self.workers,
+            "worker_id": self.worker_id,
+            "max_queue": self.max_queue,
+            "queue_depth": counts.get("queued", 0),
+            "jobs": counts,
+            "running_here": self.running,
+            "claimed": self.claimed,
+            "redelivered": self.redelivered,
+            "requeued": self.requeued,
+            "dead_lettered": self.dead_lettered,
+            "leases_lost": self.leases_lost,
+            "rejected": self.rejected,
+        }
+
+
+analysis_jobs = AnalysisJobs(
+    Path(ANALYSIS_JOB_DB) if ANALYSIS_JOB_DB else UPLOAD_DIR / ".jobs.sqlite3",
+    workers=ANALYSIS_JOB_WORKERS,
+    max_queue=ANALYSIS_JOB_MAX_QUEUE,
+    ttl=ANALYSIS_JOB_TTL,
+    lease_seconds=ANALYSIS_JOB_LEASE_SECONDS,
+    max_attempts=ANALYSIS_JOB_MAX_ATTEMPTS,
+    poll_interval=ANALYSIS_JOB_POLL_INTERVAL,
+)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_analysis_job(payload: Request):
+    """
+    Same JSON body as /api/analyze_with_genai, but returns a job id right away;
+    poll GET /api/jobs/{job_id} for the result.
+    """
+    body = await payload.json()
+    wav_path = resolve_wav_path(body.get("wav_filename"))
+    try:
+        job = await analysis_jobs.submit(wav_path, body.get("keywords") or [], use_cache=not body.get("no_cache"))
+    except AnalysisJobQueueFull as e:
+        logger.warning("rejecting analysis job: %s", e)
+        raise HTTPException(status_code=503, detail="Analysis queue full, retry later", headers={"Retry-After": "5"})
+    return {**job, "poll_url": f"/api/jobs/{job['job_id']}"}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_analysis_job(job_id: str, wait: float = Query(0.0, ge=0)):
+    """
+    Job status: queued, running, done, failed or dead (gave up after
+    ANALYSIS_JOB_MAX_ATTEMPTS). When done, "response" holds the
+    /api/analyze_with_genai body; otherwise "error" holds the last status code
+    and detail. ?wait=<seconds> long-polls until the job finishes.
+    """
+    job = await analysis_jobs.get(job_id, min(wait, ANALYSIS_JOB_MAX_WAIT))
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown or expired job id")
+    return job
 
 
 @app.get("/api/list")
 def list_files():
     """Optional helper to list converted WAVs (for dev)."""
     files = sorted([p.name for p in UPLOAD_DIR.glob("*.wav")])
-    return {"count": len(files), "files": files}
\ No newline at end of file
+    return {"count": len(files), "files": files}
+
+
+@app.get("/api/metrics")
+def metrics():
+    """Runtime counters for sizing pools and checking cache/queue behaviour."""
+    return {
+        "conversion": conversion_scheduler.snapshot(),
+        "conversion_paths": dict(conversion_path_counts),
+        "dedup": dedup_index.snapshot(),
+        "upload_ids": file_counter.snapshot(),
+        "genai_files": genai_file_cache.snapshot(),
+        "analysis_cache": analysis_cache.snapshot(),
+        "analysis_singleflight": analysis_singleflight.snapshot(),
+        "genai_limiter": genai_limiter.snapshot(),
+        "genai_breaker": genai_breaker.snapshot(),
+        "analysis_jobs": analysis_jobs.snapshot(),
+        "genai_retries": {
+            **dict(genai_retry_stats),
+            "generate_p95_seconds": generate_latency.percentile(95),
+        },
+        "analysis_stream": {
+            "streams": analysis_stream_stats["streams"],
+            "completed": analysis_stream_stats["completed"],
+            "errors": analysis_stream_stats["errors"],
+            "avg_ttfb_seconds": round(analysis_stream_stats["ttfb_total"] / analysis_stream_stats["ttfb_count"], 4)
+            if analysis_stream_stats["ttfb_count"] else 0.0,
+            "max_ttfb_seconds": round(analysis_stream_stats["ttfb_max"], 4),
+        },
+        "genai_parse": {
+            mode: {
+                **{k: counts[k] for k in ("generations", "parse_failures", "retries", "retry_parse_failures")},
+                "retry_rate": round(counts["retries"] / counts["generations"], 4) if counts["generations"] else 0.0,
+            }
+            for mode, counts in genai_parse_stats.items()
+        },
+    }
@@ -0,0 +1,104 @@
+"""
+Compare PyAVConverter with FfmpegCliConverter on the same clips: wall time per
+conversion and CPU spent (in-process for PyAV, child processes for ffmpeg).
+
+    python tests/bench_converters.py [--runs 20] [--seconds 30] [--concurrency 4]
+
+Not collected by pytest. Exits without running if the ffmpeg binary or PyAV
+is missing, since there is nothing to compare against.
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="bench-uploads-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+# iPhone/Chrome-style recordings: codec args for a 48 kHz stereo sine
+FORMATS = {
+    "webm": ["-c:a", "libopus"],
+    "m4a": ["-c:a", "aac"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+
+def make_clip(path: Path, seconds: int, codec_args: list[str]) -> None:
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-f", "lavfi",
+         "-i", f"sine=frequency=440:sample_rate=48000:duration={seconds}",
+         "-ac", "2", *codec_args, str(path)],
+        check=True,
+    )
+
+
+def _cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+async def bench(converter, src: Path, workdir: Path, runs: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int) -> None:
+        async with sem:
+            started = time.perf_counter()
+            await converter.convert(src, workdir / f"{converter.name}-{i}.wav")
+            latencies.append(time.perf_counter() - started)
+
+    cpu_before = _cpu_seconds()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    wall = time.perf_counter() - started
+    cpu = _cpu_seconds() - cpu_before
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[max(0, int(len(latencies) * 0.95) - 1)] * 1000,
+        "cpu_ms_per_file": cpu / runs * 1000,
+        "files_per_s": runs / wall,
+    }
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seconds", type=int, default=30, help="clip length")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        print("skipped: no ffmpeg binary on PATH")
+        return 0
+    if main.av is None:
+        print("skipped: PyAV is not installed")
+        return 0
+
+    converters = [main.FfmpegCliConverter(), main.PyAVConverter()]
+    print(f"{args.runs} runs, {args.seconds}s clips, concurrency {args.concurrency}")
+    print(f"{'format':<6} {'converter':<8} {'p50 ms':>8} {'p95 ms':>8} {'cpu ms/file':>12} {'files/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for ext, codec_args in FORMATS.items():
+            src = workdir / f"clip.{ext}"
+            make_clip(src, args.seconds, codec_args)
+            for converter in converters:
+                r = asyncio.run(bench(converter, src, workdir, args.runs, args.concurrency))
+                print(f"{ext:<6} {converter.name:<8} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                      f"{r['cpu_ms_per_file']:>12.1f} {r['files_per_s']:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,22 @@
+import io
+import os
+import sys
+import tempfile
+import wave
+from pathlib import Path
+
+# main.py creates UPLOAD_DIR, the job database and its caches at import time;
+# point it at a scratch directory before any test imports it
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="uploads-test-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def wav_bytes(seconds: float = 0.1, sample: int = 0) -> bytes:
+    """A mono 16-bit 16 kHz WAV of `seconds` with every sample set to `sample`."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(sample.to_bytes(2, "little", signed=True) * int(16000 * seconds))
+    return buf.getvalue()
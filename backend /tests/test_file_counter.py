@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+
+PROCESSES = 6
+THREADS = 4
+PER_PROCESS = 400
+
+
+def _allocate(path: str, block_size: int, use_fcntl: bool, count: int) -> list:
+    if not use_fcntl:
+        main.fcntl = None
+    counter = main.FileCounter(main.Path(path), block_size=block_size)
+    with ThreadPoolExecutor(THREADS) as ex:
+        return list(ex.map(lambda _: counter.next(), range(count)))
+
+
+@pytest.mark.parametrize(
+    "use_fcntl, block_size",
+    [(True, 1), (False, 1), (True, 50)],
+    ids=["fcntl", "o_excl", "fcntl-blocks"],
+)
+def test_concurrent_processes_never_share_an_id(tmp_path, use_fcntl, block_size):
+    if use_fcntl and main.fcntl is None:
+        pytest.skip("fcntl not available")
+    path = str(tmp_path / ".counter")
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(PROCESSES) as pool:
+        results = pool.starmap(_allocate, [(path, block_size, use_fcntl, PER_PROCESS)] * PROCESSES)
+    ids = [i for r in results for i in r]
+    assert len(ids) == PROCESSES * PER_PROCESS
+    assert len(set(ids)) == len(ids)
+    # the persisted high-water mark covers every id handed out
+    assert int((tmp_path / ".counter").read_text()) >= max(ids)
+
+
+def test_new_process_continues_after_leased_block(tmp_path):
+    first = main.FileCounter(tmp_path / ".counter", block_size=1000)
+    assert [first.next() for _ in range(3)] == [1, 2, 3]
+    assert (tmp_path / ".counter").read_text() == "1000"
+    second = main.FileCounter(tmp_path / ".counter", block_size=1000)
+    assert second.next() == 1001
+
+
+def test_missing_counter_resumes_after_existing_uploads(tmp_path):
+    (tmp_path / "41.webm").write_bytes(b"")
+    (tmp_path / "42.wav").write_bytes(b"")
+    assert main.FileCounter(tmp_path / ".counter").next() == 43
+
+
+def test_stale_o_excl_lock_is_taken_over(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "fcntl", None)
+    counter = main.FileCounter(tmp_path / ".counter", stale_lock_seconds=1)
+    counter.lock_path.write_text("")
+    old = time.time() - 60
+    os.utime(counter.lock_path, (old, old))
+    assert counter.next() == 1
+    assert not counter.lock_path.exists()
+    assert not list(tmp_path.glob("*.stale"))
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from conftest import wav_bytes
+
+N = 20
+GENAI_SECONDS = 0.5
+
+MODEL_OUTPUT = json.dumps({
+    "transcript": "hello there",
+    "scores": {"fluency": 80, "confidence": 70},
+    "counts": {"total_words": 2, "total_fillers": 0, "long_pauses": 0},
+    "suggestions": ["keep going"],
+})
+
+
+class _FakeAsyncGenAI:
+    """Minimal client.aio stand-in whose calls take GENAI_SECONDS and track how many overlap."""
+
+    def __init__(self):
+        self.inflight = 0
+        self.peak = 0
+        self.models = SimpleNamespace(generate_content=self._generate_content)
+        self.files = SimpleNamespace(upload=self._upload)
+
+    async def _call(self):
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        try:
+            await asyncio.sleep(GENAI_SECONDS)
+        finally:
+            self.inflight -= 1
+
+    async def _generate_content(self, model, contents, config=None):
+        await self._call()
+        return SimpleNamespace(text=MODEL_OUTPUT)
+
+    async def _upload(self, file, config=None):
+        await self._call()
+        return SimpleNamespace(name="files/x", uri="https://example.invalid/files/x", mime_type="audio/wav", expiration_time=None)
+
+
+@pytest.fixture
+def fake_genai(monkeypatch, tmp_path):
+    aio = _FakeAsyncGenAI()
+    monkeypatch.setattr(main, "client", SimpleNamespace(aio=aio))
+    monkeypatch.setattr(main, "genai_limiter", main.GenAILimiter(N, 0, 0, 30))
+    monkeypatch.setattr(main, "genai_file_cache", main.GenAIFileCache(tmp_path / ".genai_files.json"))
+    monkeypatch.setattr(main, "genai_breaker", main.CircuitBreaker("test", 20, 10, 0.5, 30, 1))
+    return aio
+
+
+@pytest.mark.parametrize("inline_max_bytes, audio_mode", [(10 ** 9, "inline"), (0, "files_api")])
+def test_many_analyses_in_flight_on_one_worker(fake_genai, monkeypatch, inline_max_bytes, audio_mode):
+    monkeypatch.setattr(main, "GENAI_INLINE_MAX_BYTES", inline_max_bytes)
+
+    async def run_all():
+        # distinct content per clip so neither the cache nor coalescing merges them
+        return await asyncio.gather(*[main.analyze_audio(wav_bytes(sample=i), ["k"], use_cache=False) for i in range(N)])
+
+    started = time.monotonic()
+    results = asyncio.run(run_all())
+    elapsed = time.monotonic() - started
+
+    assert [r["status"] for r in results] == ["ok"] * N
+    assert {r["audio_mode"] for r in results} == {audio_mode}
+    assert fake_genai.peak == N
+    # one (inline) or two (upload + generate) GenAI round trips, not N of them in series
+    round_trips = 1 if audio_mode == "inline" else 2
+    assert elapsed < GENAI_SECONDS * round_trips * 3, f"{N} analyses took {elapsed:.2f}s"
+
+
+def test_joining_an_inflight_upload_is_not_reported_as_cached(tmp_path):
+    cache = main.GenAIFileCache(tmp_path / ".genai_files.json")
+    uploads = 0
+
+    async def upload():
+        nonlocal uploads
+        uploads += 1
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(name="files/a", uri="uri://a", mime_type="audio/wav")
+
+    async def run():
+        joined = await asyncio.gather(*[cache.get_or_upload("a" * 64, upload) for _ in range(3)])
+        return joined, await cache.get_or_upload("a" * 64, upload)
+
+    joined, later = asyncio.run(run())
+    assert uploads == 1
+    assert [cached for _, cached in joined] == [False] * 3
+    assert later[1] is True
+
+
+@pytest.mark.parametrize("use_fcntl", [True, False])
+def test_concurrent_writers_keep_every_handle(tmp_path, monkeypatch, use_fcntl):
+    if not use_fcntl:
+        monkeypatch.setattr(main, "fcntl", None)
+    path = tmp_path / ".genai_files.json"
+    # one cache object per "worker process", all writing the same file
+    caches = [main.GenAIFileCache(path) for _ in range(8)]
+    entry = {"name": "f", "uri": "u", "mime_type": "audio/wav", "expires_at": time.time() + 3600}
+
+    def write(i):
+        for j in range(10):
+            caches[i]._save(f"{i}-{j}", entry)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(len(caches))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(json.loads(path.read_text())) == 80
@@ -0,0 +1,73 @@
+import time
+import tracemalloc
+import wave
+
+import pytest
+
+import main
+
+np = pytest.importorskip("numpy")
+
+
+def _write_wav(path, samples, rate, channels=1):
+    pcm = np.clip(np.round(samples * 32767.0), -32768, 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
+
+
+def _read_wav(path):
+    with wave.open(str(path), "rb") as wf:
+        assert (wf.getnchannels(), wf.getframerate(), wf.getsampwidth()) == (1, 16000, 2)
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2").astype(np.float64) / 32768.0
+
+
+@pytest.mark.parametrize("rate", [8000, 22050, 44100, 48000])
+def test_resampled_sine_snr(tmp_path, rate):
+    t = np.arange(rate * 2) / rate
+    tone = 0.5 * np.sin(2 * np.pi * 1000.0 * t)
+    _write_wav(tmp_path / "in.wav", np.repeat(tone, 2), rate, channels=2)
+    main.resample_pcm_wav(tmp_path / "in.wav", tmp_path / "out.wav")
+
+    y = _read_wav(tmp_path / "out.wav")
+    assert abs(len(y) - 32000) <= 1
+    ref = 0.5 * np.sin(2 * np.pi * 1000.0 * np.arange(len(y)) / 16000)
+    core = slice(400, len(y) - 400)  # skip filter edge transients
+    snr = 10 * np.log10(np.sum(ref[core] ** 2) / np.sum((y[core] - ref[core]) ** 2))
+    assert snr > 50, f"{rate} Hz: SNR {snr:.1f} dB"
+
+
+def test_block_boundaries_do_not_change_output():
+    x = np.random.default_rng(0).standard_normal(44100 + 123).astype(np.float32)
+    whole = main.resample_poly(x, 160, 441)
+    pieces = np.split(x, [1, 1000, 5000, 5001, len(x) - 7])
+    streamed = np.concatenate(list(main.resample_poly_blocks(pieces, 160, 441)))
+    assert np.array_equal(whole, streamed)
+
+
+def _resample_file(tmp_path, seconds, rate=48000):
+    """Resample a stereo 16-bit WAV of `seconds`; returns (peak traced bytes, elapsed, input bytes)."""
+    t = np.arange(rate * seconds, dtype=np.float32) / rate
+    src = tmp_path / f"in-{seconds}.wav"
+    _write_wav(src, np.repeat(0.3 * np.sin(2 * np.pi * 440.0 * t), 2), rate, channels=2)
+    del t
+    tracemalloc.start()
+    started = time.monotonic()
+    main.resample_pcm_wav(src, tmp_path / "out.wav")
+    elapsed = time.monotonic() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(_read_wav(tmp_path / "out.wav")) == 16000 * seconds
+    return peak, elapsed, src.stat().st_size
+
+
+def test_long_file_memory_is_bounded_and_throughput_is_high(tmp_path):
+    short_peak, _, _ = _resample_file(tmp_path, 15)
+    long_peak, elapsed, input_bytes = _resample_file(tmp_path, 240)  # ~46 MB input
+
+    # per-block temporaries only: 16x the audio must not need more memory
+    assert long_peak < short_peak * 1.25, f"peak {short_peak / 1e6:.1f} MB -> {long_peak / 1e6:.1f} MB"
+    assert long_peak < input_bytes / 2
+    assert 240 / elapsed > 20, f"240s of audio took {elapsed:.2f}s"
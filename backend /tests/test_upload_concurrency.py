@@ -0,0 +1,73 @@
+import asyncio
+import subprocess
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+import main
+from conftest import wav_bytes
+
+N = 8
+FFMPEG_SECONDS = 0.5
+
+
+class _FakeStdin:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _FakeFfmpeg:
+    """Stands in for an ffmpeg process: takes FFMPEG_SECONDS, then writes a WAV to the last argument."""
+
+    def __init__(self, cmd, stdin):
+        self.output = Path(cmd[-1])
+        self.stdin = _FakeStdin() if stdin == subprocess.PIPE else None
+        self.returncode = None
+
+    async def wait(self):
+        if self.returncode is None:
+            await asyncio.sleep(FFMPEG_SECONDS)
+            self.output.write_bytes(wav_bytes())
+            self.returncode = 0
+        return self.returncode
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    async def create_subprocess_exec(*cmd, stdin=None, stdout=None, stderr=None):
+        return _FakeFfmpeg(cmd, stdin)
+
+    monkeypatch.setattr(main.asyncio, "create_subprocess_exec", create_subprocess_exec)
+    monkeypatch.setattr(main, "audio_converter", main.FfmpegCliConverter())
+    monkeypatch.setattr(main, "conversion_scheduler", main.ConversionScheduler(N, N))
+    monkeypatch.setattr(main, "UPLOAD_DEDUP", False)
+
+
+async def _upload_many(filename: str) -> list:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*[
+            client.post("/api/upload-audio", files={"file": (filename, f"fake audio {i}".encode(), "audio/webm")})
+            for i in range(N)
+        ])
+
+
+@pytest.mark.parametrize("filename, conversion", [("answer.webm", "ffmpeg-pipe"), ("answer.m4a", "ffmpeg-file")])
+def test_parallel_uploads_take_max_not_sum_of_conversion_time(fake_ffmpeg, filename, conversion):
+    started = time.monotonic()
+    responses = asyncio.run(_upload_many(filename))
+    elapsed = time.monotonic() - started
+
+    assert [r.status_code for r in responses] == [200] * N
+    assert {r.json()["conversion"] for r in responses} == {conversion}
+    assert len({r.json()["wav_filename"] for r in responses}) == N
+    # serialized conversions would take N * FFMPEG_SECONDS
+    assert elapsed < FFMPEG_SECONDS * 3, f"{N} uploads took {elapsed:.2f}s"
@@ -73,42 +73,26 @@ function App() {
         type: chunksRef.current[0]?.type || "audio/webm",
       });
 
-      // upload
-      setStatus("Uploading audio...");
+      // upload + analyze in a single request
+      setStatus("Uploading and analyzing with Gemini (GenAI)...");
       try {
-        const form = new FormData();
-        form.append("file", blob, "answer.webm");
-
-        const uploadResp = await fetch(`${API_BASE}/api/upload-audio`, {
-          method: "POST",
-          body: form,
-        });
-
-        if (!uploadResp.ok) {
-          const text = await uploadResp.text();
-          throw new Error(`Upload failed: ${uploadResp.status} ${text}`);
-        }
-
-        const uploadJson = await uploadResp.json();
-        const wavFilename = uploadJson.wav_filename;
-        if (!wavFilename) throw new Error("Server did not return wav_filename");
-
-        // call analyze endpoint right away
-        setStatus("Analyzing with Gemini (GenAI)...");
         const keywordsArray = keywords
           .split(",")
           .map((k) => k.trim())
           .filter(Boolean);
 
-        const analyzeResp = await fetch(`${API_BASE}/api/analyze_with_genai`, {
+        const form = new FormData();
+        form.append("file", blob, "answer.webm");
+        form.append("keywords", keywordsArray.join(","));
+
+        const analyzeResp = await fetch(`${API_BASE}/api/upload-and-analyze`, {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ wav_filename: wavFilename, keywords: keywordsArray }),
+          body: form,
         });
 
         if (!analyzeResp.ok) {
           const text = await analyzeResp.text();
-          throw new Error(`Analyze failed: ${analyzeResp.status} ${text}`);
+          throw new Error(`Upload/analyze failed: ${analyzeResp.status} ${text}`);
         }
 
         const analyzeJson = await analyzeResp.json();
@@ -116,6 +100,10 @@ function App() {
         if (analyzeJson.status === "ok" && analyzeJson.result) {
           setAnalysis(analyzeJson.result);
           setStatus("Analysis complete");
+        } else if (analyzeJson.status === "degraded" && analyzeJson.result) {
+          // GenAI unavailable: only local pause/duration stats came back
+          setAnalysis(analyzeJson.result);
+          setStatus(analyzeJson.message || "GenAI unavailable, showing local stats only");
         } else {
           // model could return error object or raw text
           setAnalysis({ error: analyzeJson });